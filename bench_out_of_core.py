@@ -0,0 +1,155 @@
+"""
+Benchmark of the out-of-core mode of csv_analyzer
+
+- generate CSV files of growing size
+- run the same aggregation in memory (exec_code on the whole df)
+  and out-of-core (exec_code_out_of_core, reading in chunks)
+- measure the peak RSS and the time, each mode and size in a fresh process
+  (tracemalloc doesn't see the buffers of the pandas C parser)
+
+the peak memory of the out-of-core mode should stay flat as the file grows.
+No LLM is called: the code is fixed, as if generated by the model.
+Peak RSS is read with the resource module (Linux and macOS).
+
+usage:
+    python bench_out_of_core.py
+"""
+
+import io
+import os
+import sys
+import json
+import resource
+import tempfile
+import subprocess
+from time import time
+
+import numpy as np
+import pandas as pd
+
+import csv_analyzer
+from csv_analyzer import read_csv, exec_code, exec_code_out_of_core
+
+# number of rows of the files generated
+SIZES = [250_000, 500_000, 1_000_000, 2_000_000]
+CHUNKSIZE = 100_000
+
+CODE_IN_MEMORY = """
+print("Average amount and count by city")
+print(df.groupby("city")["amount"].agg(["mean", "count"]))
+"""
+
+CODE_OUT_OF_CORE = """
+sums = None
+counts = None
+for chunk in pd.read_csv(file_path, chunksize=chunksize, usecols=["city", "amount"]):
+    grouped = chunk.groupby("city")["amount"]
+    sums = grouped.sum() if sums is None else sums.add(grouped.sum(), fill_value=0)
+    counts = grouped.count() if counts is None else counts.add(grouped.count(), fill_value=0)
+print("Average amount and count by city")
+print(pd.DataFrame({"mean": sums / counts, "count": counts.astype(int)}))
+"""
+
+
+def generate_csv(path, n_rows, seed=42):
+    """
+    write a csv with n_rows, in chunks (to keep memory low also here)
+    """
+    rng = np.random.default_rng(seed)
+    cities = np.array(["London", "Paris", "Rome", "Berlin", "Madrid"])
+
+    for start in range(0, n_rows, CHUNKSIZE):
+        n = min(CHUNKSIZE, n_rows - start)
+        chunk = pd.DataFrame(
+            {
+                "id": np.arange(start, start + n),
+                "city": cities[rng.integers(0, len(cities), n)],
+                "amount": rng.normal(100, 20, n).round(2),
+                "notes": rng.choice(["ok", "late", "cancelled", "refunded"], n),
+            }
+        )
+        chunk.to_csv(path, mode="a", header=start == 0, index=False)
+
+
+def peak_rss_mb():
+    """
+    return the peak RSS (MB) of this process
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KB on Linux, bytes on macOS
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def run_in_memory(path):
+    return exec_code(read_csv(path), CODE_IN_MEMORY)
+
+
+def run_out_of_core(path):
+    return exec_code_out_of_core(path, CODE_OUT_OF_CORE, CHUNKSIZE)
+
+
+MODES = {
+    # imports and a tiny read: the floor of the peak RSS of the other modes
+    "baseline": lambda path: read_csv(io.StringIO("a,b\n1,2\n")),
+    "in-memory": run_in_memory,
+    "out-of-core": run_out_of_core,
+}
+
+
+def run_mode(mode, path):
+    """
+    body of the child process: run the mode and print peak RSS and time as JSON
+    """
+    csv_analyzer.DEBUG = False
+
+    time_start = time()
+    MODES[mode](path)
+    elapsed = time() - time_start
+
+    print(json.dumps({"peak_mb": peak_rss_mb(), "sec": elapsed}))
+
+
+def measure(mode, path):
+    """
+    run the mode in a fresh process (the peak RSS of a process never goes down),
+    return the peak RSS (MB) and the time (sec.)
+    """
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), mode, path],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return result["peak_mb"], result["sec"]
+
+
+def main():
+    base_mb, _ = measure("baseline", os.devnull)
+    print(f"Peak RSS of a process reading a tiny CSV: {base_mb:.1f} MB")
+    print("")
+    print(
+        f"{'rows':>10} {'file MB':>8} | {'in-memory RSS MB':>16} {'sec.':>6} | "
+        f"{'out-of-core RSS MB':>18} {'sec.':>6}"
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_rows in SIZES:
+            path = os.path.join(tmp_dir, f"bench_{n_rows}.csv")
+            generate_csv(path, n_rows)
+            file_mb = os.path.getsize(path) / 1024**2
+
+            peak_mem, time_mem = measure("in-memory", path)
+            peak_ooc, time_ooc = measure("out-of-core", path)
+
+            print(
+                f"{n_rows:>10} {file_mb:>8.1f} | {peak_mem:>16.1f} {time_mem:>6.2f} | "
+                f"{peak_ooc:>18.1f} {time_ooc:>6.2f}"
+            )
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        run_mode(sys.argv[1], sys.argv[2])
+    else:
+        main()
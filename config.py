@@ -13,6 +13,38 @@ TEMPERATURE = 0.1
 MAX_TOKENS = 1024
 TOP_P = 0.9
 
+# model profiles, for routing (see router.py)
+# the large model is the one defined above
+MODEL_PROFILES = {
+    "fast": {
+        "model_id": "cohere.command-r-08-2024",
+        "temperature": TEMPERATURE,
+        "max_tokens": MAX_TOKENS,
+        "top_p": TOP_P,
+    },
+    "large": {
+        "model_id": MODEL_ID,
+        "temperature": TEMPERATURE,
+        "max_tokens": MAX_TOKENS,
+        "top_p": TOP_P,
+    },
+}
+DEFAULT_PROFILE = "large"
+
+# router.py
+# if disabled every request goes to DEFAULT_PROFILE
+ROUTING_ENABLED = True
+# profile for each magic and csv_analyzer stage
+ROUTES = {
+    "ask": "fast",
+    "ask_data": "large",
+    "ask_code": "large",
+    "csv_generate_code": "large",
+    "csv_generate_answer": "fast",
+}
+# a request routed to fast goes to large if the prompt is bigger (est. tokens)
+ROUTING_MAX_FAST_TOKENS = 2000
+
 # OCI general
 COMPARTMENT_ID = "ocid1.compartment.oc1..aaaaaaaaushuwb2evpuf7rcpl4r7ugmqoe7ekmaiik3ra3m7gec3d234eknq"
 
@@ -24,3 +56,64 @@ MAX_ROWS_IN_SAMPLE = 4000
 
 # compute tokens
 TOKENIZER = "cl100k_base"
+
+# prefetch.py
+# speculative prefetch of the data context after each executed cell
+PREFETCH_CONTEXT = False
+# a single worker, to avoid competing with the user's code
+PREFETCH_MAX_WORKERS = 1
+# max number of DataFrames scheduled after each cell
+PREFETCH_MAX_PER_CELL = 4
+# DataFrames bigger than this (shallow memory usage) are not prefetched
+PREFETCH_MAX_DF_BYTES = 500 * 1024 * 1024
+# max total size (chars) of the cached summaries
+PREFETCH_MAX_CACHE_CHARS = 2_000_000
+# nice increment for the worker thread (Linux only, 0 to disable)
+PREFETCH_THREAD_NICE = 10
+# number of first and last rows hashed to detect in-place changes
+PREFETCH_FINGERPRINT_ROWS = 5
+
+# session_store.py
+# persist history, stats and caches across kernel restarts
+SESSION_STORE_ENABLED = False
+# one db for each project (the working directory of the notebook), in this dir
+# (in it, the records of each notebook are kept apart)
+SESSION_STORE_DIR = "~/.oci_genai_magics/sessions"
+# set to use a single db, instead of one for each project
+SESSION_STORE_PATH = None
+# max number of messages kept (and restored) in history
+SESSION_STORE_MAX_MESSAGES = 200
+# max number of entries for each cache
+SESSION_STORE_MAX_CACHE_ENTRIES = 5000
+# at startup, compact the log if it has more rows than this
+SESSION_STORE_COMPACT_ROWS = 20000
+
+# resilient_llm.py
+# max time (sec.) for a call (for streaming: time to the first chunk)
+LLM_TIMEOUT = 60
+# retries with exponential backoff and jitter
+LLM_MAX_RETRIES = 3
+LLM_BACKOFF_BASE = 1.0
+LLM_BACKOFF_MAX = 20.0
+# hedged requests: fire a second call when the first is slower than the percentile
+LLM_HEDGE_REQUESTS = False
+LLM_HEDGE_PERCENTILE = 95
+# min number of latencies observed before hedging
+LLM_HEDGE_MIN_SAMPLES = 10
+# number of recent latencies kept
+LLM_LATENCY_WINDOW = 100
+
+# result_cache.py
+# cache of generated code, captured output and answers in csv_analyzer
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_MAX_ENTRIES = 256
+# max total size (chars) of the cached outputs and answers
+RESULT_CACHE_MAX_BYTES = 50 * 1024 * 1024
+# max age (sec.) of an entry
+RESULT_CACHE_MAX_AGE = 24 * 3600
+
+# csv_analyzer.py
+# CSV files bigger than this are analyzed out-of-core (in chunks)
+LARGE_FILE_THRESHOLD_BYTES = 500 * 1024 * 1024
+# number of rows for each chunk
+CHUNK_ROWS = 100_000
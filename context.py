@@ -133,7 +133,7 @@ def get_variable_info(name: str, value: Any) -> str:
     return "\n".join(info_parts)
 
 
-def get_context(user_ns: Dict[str, Any], line: str) -> str:
+def get_context(user_ns: Dict[str, Any], line: str, prefetcher=None) -> str:
     """
     Extract and return relevant context from the user's namespace
     based on the variables mentioned in the query line.
@@ -143,6 +143,8 @@ def get_context(user_ns: Dict[str, Any], line: str) -> str:
             and their corresponding values.
         line (str): The input query string potentially referencing variables
             in the namespace.
+        prefetcher (ContextPrefetcher, optional): if provided, the summaries
+            already prefetched are reused instead of being computed again.
 
     Returns:
         str: A formatted string containing detailed information about the variables
@@ -173,6 +175,12 @@ def get_context(user_ns: Dict[str, Any], line: str) -> str:
             # print("Adding: ", var_name)
 
             var_value = filtered_ns[var_name]
-            context_parts.append(get_variable_info(var_name, var_value))
+
+            var_info = None
+            if prefetcher is not None:
+                var_info = prefetcher.get(var_name, var_value)
+            if var_info is None:
+                var_info = get_variable_info(var_name, var_value)
+            context_parts.append(var_info)
 
     return "\n".join(context_parts)
@@ -5,21 +5,45 @@ CSV analyzer
 - load the csv in a pandas dataframe
 - generate the code
 - execute the code
+- results are cached, keyed by data fingerprint and generated code
+- the stages are pipelined: the code is generated from a random sample
+  of the rows while the whole file is loaded, code and answer are streamed as events
+- files bigger than LARGE_FILE_THRESHOLD_BYTES are analyzed out-of-core:
+  the code generated reads the file in chunks, with bounded memory
 
 """
 
-import sys
+import os
 import io
+import random
+from itertools import islice
+from contextlib import redirect_stdout
+from time import time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 
 from langchain_core.messages import HumanMessage, SystemMessage
 from code_parser_utils import remove_triple_backtics
 from context import get_variable_info
-from oci_models import get_llm
-from prompts import PROMPT_ASK_CODE
+from router import get_routed_llm
+from prompts import PROMPT_ASK_CODE, PROMPT_ASK_CODE_LARGE_FILE
+from result_cache import ResultCache, file_fingerprint, dataframe_fingerprint
+from config import (
+    RESULT_CACHE_ENABLED,
+    LARGE_FILE_THRESHOLD_BYTES,
+    CHUNK_ROWS,
+    MAX_ROWS_IN_SAMPLE,
+)
 
 DEBUG = True
 
+# shared by the script and the batch path
+RESULT_CACHE = ResultCache() if RESULT_CACHE_ENABLED else None
+
+# to load the data while the code is generated
+_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="csv-analyzer")
+
+
 def read_csv(file):
     """
     read the csv file and return a pandas dataframe
@@ -27,13 +51,65 @@ def read_csv(file):
     return pd.read_csv(file)
 
 
-def generate_code(df, question):
+def is_large_file(file):
     """
-    generate the code, to be executed on the df, to answer to the question
+    check if the file must be analyzed out-of-core
     """
-    llm = get_llm()
+    return os.path.getsize(file) > LARGE_FILE_THRESHOLD_BYTES
+
 
-    df_info = get_variable_info("df", df)
+def read_csv_sample(file, n_rows=MAX_ROWS_IN_SAMPLE, seed=42):
+    """
+    read a random sample of the rows of the csv file, to build the context
+
+    the rows are taken at random byte offsets, so only the sample is read, not the
+    whole file, but values from any part of the file reach the prompt.
+    Trade-offs: long rows are a bit more likely to be picked, dtypes are inferred
+    on the sample (they can differ from the full read) and a quoted field with
+    newlines can be split (bad lines are skipped)
+    """
+    with open(file, "rb") as f:
+        header = f.readline()
+        start = f.tell()
+        lines = list(islice(f, n_rows + 1))
+
+        if len(lines) <= n_rows:
+            # small file, read it all
+            rows = lines
+        else:
+            size = os.path.getsize(file)
+            rng = random.Random(seed)
+            # from start - 1 (the end of the header) the first row can be picked too
+            offsets = sorted(rng.randrange(start - 1, size) for _ in range(n_rows))
+            # position -> row, to skip duplicates
+            picked = {}
+            for offset in offsets:
+                f.seek(offset)
+                # skip the rest of the current row, take the next one
+                f.readline()
+                position = f.tell()
+                if position not in picked:
+                    picked[position] = f.readline()
+            rows = [row for row in picked.values() if row.strip()]
+
+    rows = [row if row.endswith(b"\n") else row + b"\n" for row in rows]
+    return pd.read_csv(io.BytesIO(header + b"".join(rows)), on_bad_lines="skip")
+
+
+def build_code_messages(df, question, file_path=None):
+    """
+    build the messages to ask for the code, to be executed on the df
+    or, if file_path is given, out-of-core on the file (df is a sample)
+    """
+    if file_path is None:
+        prompt = PROMPT_ASK_CODE
+        df_info = get_variable_info("df", df)
+    else:
+        prompt = PROMPT_ASK_CODE_LARGE_FILE
+        df_info = (
+            f"File size (bytes): {os.path.getsize(file_path)}\n"
+            f"{get_variable_info('sample', df)}"
+        )
 
     # print(df_info)
 
@@ -41,21 +117,24 @@ def generate_code(df, question):
     Context: {df_info}\n
     Question: {question}
     """
-    messages = [
-        SystemMessage(content=PROMPT_ASK_CODE),
+    return [
+        SystemMessage(content=prompt),
         HumanMessage(content=CONTEXT_AND_REQUEST),
     ]
 
-    _response = llm.invoke(messages)
 
-    _code = remove_triple_backtics(_response.content)
+def generate_code_stream(df, question, file_path=None):
+    """
+    generate the code, yielding the chunks as they arrive
+    (out-of-core code, if file_path is given)
+    """
+    messages = build_code_messages(df, question, file_path)
 
-    if DEBUG:
-        print("Generated code: ")
-        print(_code)
-        print("")
+    _, llm = get_routed_llm("csv_generate_code", messages, question)
 
-    return _code
+    for chunk in llm.stream(messages):
+        if chunk.content:
+            yield chunk.content
 
 
 def exec_code(_df, code):
@@ -67,14 +146,10 @@ def exec_code(_df, code):
 
     output_capture = io.StringIO()
 
-    # Redirect to StringIO
-    sys.stdout = output_capture
-
-    # exec the code
-    exec(code)
-
-    # Ripristiniamo sys.stdout al valore originale
-    sys.stdout = sys.__stdout__
+    # Redirect to StringIO, the previous stdout is restored also on errors
+    with redirect_stdout(output_capture):
+        # exec the code
+        exec(code)
 
     # Otteniamo l'output catturato come stringa
     captured_output = output_capture.getvalue()
@@ -86,12 +161,32 @@ def exec_code(_df, code):
     return captured_output
 
 
-def generate_answer(question, code_result):
+def exec_code_out_of_core(file_path, code, chunksize=CHUNK_ROWS):
     """
-    generate the answer to the question
+    execute the code generated for a large file: it reads the file in chunks
     """
-    llm = get_llm()
+    # the variables the generated code expects
+    namespace = {"pd": pd, "file_path": file_path, "chunksize": chunksize}
+
+    output_capture = io.StringIO()
+
+    # Redirect to StringIO, the previous stdout is restored also on errors
+    with redirect_stdout(output_capture):
+        exec(code, namespace)
+
+    captured_output = output_capture.getvalue()
+
+    if DEBUG:
+        print("Output: ")
+        print(captured_output)
+        print("")
+    return captured_output
+
 
+def build_answer_messages(question, code_result):
+    """
+    build the messages to ask for the answer to the question
+    """
     SYSTEM_PROMPT = f"""
     Generate a clear and concise summary that includes both the provided question and its corresponding answer.
 
@@ -105,25 +200,233 @@ def generate_answer(question, code_result):
 
     """
 
-    messages = [
+    return [
         SystemMessage(content=SYSTEM_PROMPT),
         HumanMessage(content=f"Context: {code_result}\nQuestion: {question}\n"),
     ]
 
-    return llm.invoke(messages).content
+
+def generate_answer_stream(question, code_result):
+    """
+    generate the answer to the question, yielding the chunks as they arrive
+    """
+    messages = build_answer_messages(question, code_result)
+
+    # the complexity is checked on the question, not on the output of the code
+    _, llm = get_routed_llm("csv_generate_answer", messages, question)
+
+    for chunk in llm.stream(messages):
+        if chunk.content:
+            yield chunk.content
+
+
+def _stage_event(stage, elapsed, cached=False):
+    return {"event": "stage", "stage": stage, "elapsed": elapsed, "cached": cached}
+
+
+def _timed(timings, stage, func, *args):
+    """
+    call func and record the elapsed time in timings
+    """
+    time_start = time()
+    result = func(*args)
+    timings[stage] = time() - time_start
+    return result
+
+
+def answer_question_stream(
+    data_fp,
+    load_df,
+    question,
+    cache=RESULT_CACHE,
+    load_sample=None,
+    file_path=None,
+):
+    """
+    Staged pipeline: generate and execute the code and answer to the question.
+
+    If load_sample is given, the code is generated from a sample of the data
+    while the full data is loaded in background; code and answer are streamed
+    as they are generated, and the cache is used to skip the stages already done.
+
+    Args:
+        data_fp (str): the fingerprint of the data (None: no cache).
+        load_df (callable): returns the dataframe, called only if needed.
+        question (str): the question.
+        cache (ResultCache): the cache (None to disable it).
+        load_sample (callable): returns a sample of the data, for the context.
+        file_path (str): if given, the code is generated and executed out-of-core on the file.
+
+    Yields:
+        dict: the events, with key "event":
+            - stage: a stage is completed (stage, elapsed, cached)
+            - code: a chunk of the generated code (content)
+            - output: the captured output of the code (content)
+            - answer: a chunk of the answer (content)
+            - done: the complete answer (answer), per-stage timings and total time
+    """
+    time_start = time()
+    timings = {}
+
+    if data_fp is None:
+        # no fingerprint for the data, nothing can be cached
+        cache = None
+
+    code = cache.get_code(data_fp, question) if cache else None
+    captured_output = cache.get_output(data_fp, code) if cache and code else None
+
+    # out-of-core, the code reads the file itself
+    need_df = file_path is None and captured_output is None
+    df = None
+    df_future = None
+
+    # code
+    new_code = code is None
+    if new_code:
+        if load_sample is not None:
+            if need_df:
+                # load the data while the code is generated
+                df_future = _EXECUTOR.submit(_timed, timings, "load_data", load_df)
+            context_df = _timed(timings, "load_sample", load_sample)
+            yield _stage_event("load_sample", timings["load_sample"])
+        else:
+            df = context_df = _timed(timings, "load_data", load_df)
+            yield _stage_event("load_data", timings["load_data"])
+
+        time_code = time()
+        chunks = []
+        for chunk in generate_code_stream(context_df, question, file_path):
+            chunks.append(chunk)
+            yield {"event": "code", "content": chunk}
+        code = remove_triple_backtics("".join(chunks))
+        timings["generate_code"] = time() - time_code
+
+        if DEBUG:
+            print("Generated code: ")
+            print(code)
+            print("")
+
+        yield _stage_event("generate_code", timings["generate_code"])
+    else:
+        yield {"event": "code", "content": code}
+        yield _stage_event("generate_code", 0, cached=True)
+
+    # execution
+    if captured_output is None:
+        if file_path is None:
+            if df is None:
+                if df_future is not None:
+                    df = df_future.result()
+                else:
+                    df = _timed(timings, "load_data", load_df)
+                yield _stage_event("load_data", timings["load_data"])
+
+            captured_output = _timed(timings, "exec_code", exec_code, df, code)
+        else:
+            captured_output = _timed(
+                timings, "exec_code", exec_code_out_of_core, file_path, code
+            )
+
+        if cache:
+            # the code is cached only once it has been executed successfully
+            if new_code:
+                cache.put_code(data_fp, question, code)
+            cache.put_output(data_fp, code, captured_output)
+        yield {"event": "output", "content": captured_output}
+        yield _stage_event("exec_code", timings["exec_code"])
+    else:
+        yield {"event": "output", "content": captured_output}
+        yield _stage_event("exec_code", 0, cached=True)
+
+    # answer
+    answer = cache.get_answer(data_fp, code, question) if cache else None
+    if answer is None:
+        time_answer = time()
+        chunks = []
+        for chunk in generate_answer_stream(question, captured_output):
+            chunks.append(chunk)
+            yield {"event": "answer", "content": chunk}
+        answer = "".join(chunks)
+        timings["generate_answer"] = time() - time_answer
+
+        if cache:
+            cache.put_answer(data_fp, code, question, answer)
+        yield _stage_event("generate_answer", timings["generate_answer"])
+    else:
+        yield {"event": "answer", "content": answer}
+        yield _stage_event("generate_answer", 0, cached=True)
+
+    yield {
+        "event": "done",
+        "answer": answer,
+        "timings": timings,
+        "total": time() - time_start,
+    }
+
+
+def process_request_stream(f_name, question):
+    """
+    Process the request, yielding the events of the pipeline (see answer_question_stream)
+    """
+    # the fingerprint doesn't need to read the file
+    data_fp = file_fingerprint(f_name) if RESULT_CACHE else None
+
+    if is_large_file(f_name):
+        # out-of-core: only a sample is loaded, for the context
+        return answer_question_stream(
+            data_fp,
+            None,
+            question,
+            cache=RESULT_CACHE,
+            load_sample=lambda: read_csv_sample(f_name),
+            file_path=f_name,
+        )
+
+    # the code is generated from a sample of the rows, while the whole file is loaded
+    return answer_question_stream(
+        data_fp,
+        lambda: read_csv(f_name),
+        question,
+        cache=RESULT_CACHE,
+        load_sample=lambda: read_csv_sample(f_name),
+    )
+
+
+def process_dataframe_stream(df, question):
+    """
+    Process a request on a dataframe already loaded (batch path),
+    yielding the events of the pipeline (see answer_question_stream)
+    """
+    data_fp = dataframe_fingerprint(df) if RESULT_CACHE else None
+
+    return answer_question_stream(data_fp, lambda: df, question, cache=RESULT_CACHE)
+
+
+def get_answer(events):
+    """
+    Consume the events of the pipeline and return the answer
+    """
+    for event in events:
+        if event["event"] == "done":
+            if DEBUG:
+                print("Timings: ", event["timings"])
+                print("")
+            return event["answer"]
+    return None
 
 
 def process_request(f_name, question):
     """
     Main function to process the request
     """
-    df = read_csv(f_name)
+    return get_answer(process_request_stream(f_name, question))
 
-    code = generate_code(df, question)
 
-    captured_output = exec_code(df, code)
-
-    return generate_answer(question, captured_output)
+def process_dataframe(df, question):
+    """
+    Process a request on a dataframe already loaded (batch path)
+    """
+    return get_answer(process_dataframe_stream(df, question))
 
 
 #
@@ -137,5 +440,6 @@ F_NAME = "calendar.csv"
 # QUESTION = "give me the Name of restaurant in New Your that Fabricio has recommended"
 QUESTION = "Show me the first 5 workshop where Jane is organizer or required, with all the possible details including required attendees"
 
-print(process_request(F_NAME, QUESTION))
-print("")
+if __name__ == "__main__":
+    print(process_request(F_NAME, QUESTION))
+    print("")
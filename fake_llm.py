@@ -0,0 +1,119 @@
+"""
+Fake chat model, to exercise the resilient call layer locally,
+without calling OCI GenAI.
+
+It injects latency and errors, for example:
+
+    from resilient_llm import ResilientLLM
+    from fake_llm import FakeLLM
+
+    llm = ResilientLLM(lambda: FakeLLM(latency=0.5, error_rate=0.3))
+    print(llm.invoke(messages).content)
+"""
+
+import time
+import random
+import threading
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+
+class FakeServiceError(Exception):
+    """
+    Mimic oci.exceptions.ServiceError (status and headers)
+    """
+
+    def __init__(self, status, headers=None):
+        super().__init__(f"Fake service error, status: {status}")
+        self.status = status
+        self.headers = headers or {}
+
+
+class FakeLLM:
+    """
+    A chat model with the same invoke/stream interface as ChatOCIGenAI.
+    """
+
+    def __init__(
+        self,
+        response="This is a fake response.",
+        latency=0.1,
+        slow_rate=0.0,
+        slow_latency=5.0,
+        error_rate=0.0,
+        error_status=503,
+        retry_after=None,
+        fail_first=0,
+        slow_first=0,
+        seed=None,
+    ):
+        """
+        Initialize a new instance of FakeLLM.
+
+        Args:
+            response (str): the text returned.
+            latency (float): latency (sec.) of a normal call.
+            slow_rate (float): fraction of calls with slow_latency (tail latency).
+            slow_latency (float): latency (sec.) of a slow call.
+            error_rate (float): fraction of calls failing with error_status.
+            error_status (int): the HTTP status of the errors (429 for rate limit).
+            retry_after (float): value of the retry-after header in the errors.
+            fail_first (int): the first calls (up to this number) always fail.
+            slow_first (int): the first calls (up to this number) are always slow.
+            seed (int): seed for the random generator.
+        """
+        self.response = response
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.fail_first = fail_first
+        self.slow_first = slow_first
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.n_calls = 0
+        # streams closed before the end (abandoned by the caller)
+        self.n_closed = 0
+
+    def _simulate_call(self):
+        with self._lock:
+            self.n_calls += 1
+            is_error = (
+                self.n_calls <= self.fail_first
+                or self._random.random() < self.error_rate
+            )
+            is_slow = (
+                self.n_calls <= self.slow_first
+                or self._random.random() < self.slow_rate
+            )
+
+        time.sleep(self.slow_latency if is_slow else self.latency)
+
+        if is_error:
+            headers = {}
+            if self.retry_after is not None:
+                headers["retry-after"] = str(self.retry_after)
+            raise FakeServiceError(self.error_status, headers)
+
+    def invoke(self, messages):
+        """
+        Return the response, after latency (or an error)
+        """
+        self._simulate_call()
+        return AIMessage(content=self.response)
+
+    def stream(self, messages):
+        """
+        Yield the response word by word, after latency (or an error)
+        """
+        self._simulate_call()
+        try:
+            for word in self.response.split(" "):
+                yield AIMessageChunk(content=word + " ")
+        except GeneratorExit:
+            with self._lock:
+                self.n_closed += 1
+            raise
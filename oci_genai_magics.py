@@ -7,6 +7,7 @@ partially inspired by:
 """
 
 import logging
+import hashlib
 from time import time
 from IPython.core.magic import Magics, line_magic, cell_magic, magics_class
 from IPython import get_ipython
@@ -14,19 +15,24 @@ from IPython.display import display, Markdown
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 import tiktoken
 
-from oci_models import get_llm
+from resilient_llm import get_resilient_stats
+from router import get_routed_llm, get_routing_stats, clear_routing_stats
 from context import filter_variables, get_context
+from prefetch import ContextPrefetcher
+from session_store import SessionStore, get_session_name, get_session_store_path
 from code_parser_utils import remove_triple_backtics, add_header
 from prompts import PROMPT_ASK, PROMPT_ASK_CODE, PROMPT_ASK_DATA
 
 from config import (
-    MODEL_ID,
     SERVICE_ENDPOINT,
-    MAX_TOKENS,
-    TEMPERATURE,
-    TOP_P,
+    MODEL_PROFILES,
+    DEFAULT_PROFILE,
+    ROUTING_ENABLED,
+    ROUTES,
     MAX_MSGS_IN_HISTORY,
     TOKENIZER,
+    PREFETCH_CONTEXT,
+    SESSION_STORE_ENABLED,
 )
 
 logging.basicConfig(level=logging.INFO)
@@ -60,6 +66,64 @@ class OCIGenaiMagics(Magics):
         # to compute genai resp.time
         self.genai_requests = 0
         self.genai_total_time = 0
+        # the same stats, for each model id
+        self.model_stats = {}
+
+        # to precompute the context while the user is typing
+        self.prefetcher = ContextPrefetcher(shell)
+        if PREFETCH_CONTEXT:
+            self.prefetcher.start()
+
+        # to keep history, stats and caches across kernel restarts
+        self.store = None
+        if SESSION_STORE_ENABLED:
+            self.store = SessionStore(
+                get_session_store_path(), get_session_name(shell.user_ns)
+            )
+            self.restore_session()
+
+    def restore_session(self):
+        """
+        Restore history and stats from the session store.
+        """
+        for role, content in self.store.history:
+            if role == "human":
+                self.history.append(HumanMessage(content=content))
+            else:
+                self.history.append(AIMessage(content=content))
+
+        stats = self.store.stats
+        self.tokens_input = stats.get("tokens_input", 0)
+        self.tokens_output = stats.get("tokens_output", 0)
+        self.genai_requests = stats.get("genai_requests", 0)
+        self.genai_total_time = stats.get("genai_total_time", 0)
+        self.model_stats = stats.get("model_stats", {})
+
+    def save_stats(self):
+        """
+        Save the stats in the session store (if enabled).
+        """
+        if self.store is not None:
+            self.store.save_stats(
+                {
+                    "tokens_input": self.tokens_input,
+                    "tokens_output": self.tokens_output,
+                    "genai_requests": self.genai_requests,
+                    "genai_total_time": self.genai_total_time,
+                    "model_stats": self.model_stats,
+                }
+            )
+
+    def add_to_history(self, request, response):
+        """
+        Save in history input and output (and in the session store, if enabled).
+        """
+        self.history.append(HumanMessage(content=request))
+        self.history.append(AIMessage(content=response))
+
+        if self.store is not None:
+            self.store.append_message("human", request)
+            self.store.append_message("ai", response)
 
     def get_cell_manager(self):
         """
@@ -70,19 +134,35 @@ class OCIGenaiMagics(Magics):
         shell = ipython.kernel.shell
         return shell
 
-    def update_stats(self, _elapsed, _messages, _last_text):
+    def update_stats(self, _model_id, _elapsed, _messages, _last_text):
         """
         Update the statistics for the current session.
 
         Args:
 
+            _model_id (str): The model that served the request.
+            _elapsed (float): The response time.
             _messages (list): A list of message objects.
             _last_text: The last text message.
         """
+        _tokens_input = self.compute_tokens(_messages)
+        _tokens_output = self.compute_tokens([AIMessage(content=_last_text)])
+
         self.genai_requests += 1
         self.genai_total_time += _elapsed
-        self.tokens_input += self.compute_tokens(_messages)
-        self.tokens_output += self.compute_tokens([AIMessage(content=_last_text)])
+        self.tokens_input += _tokens_input
+        self.tokens_output += _tokens_output
+
+        _stats = self.model_stats.setdefault(
+            _model_id,
+            {"requests": 0, "total_time": 0, "tokens_input": 0, "tokens_output": 0},
+        )
+        _stats["requests"] += 1
+        _stats["total_time"] += _elapsed
+        _stats["tokens_input"] += _tokens_input
+        _stats["tokens_output"] += _tokens_output
+
+        self.save_stats()
 
     def compute_tokens(self, messages):
         """
@@ -99,11 +179,24 @@ class OCIGenaiMagics(Magics):
             if content is None:
                 content = ""
 
-            tokens = self.tokenizer.encode(content)
-            total_tokens += len(tokens)
+            total_tokens += self.count_tokens(content)
 
         return total_tokens
 
+    def count_tokens(self, content):
+        """
+        Compute the #of tokens for a text, using the session store as cache (if enabled).
+        """
+        if self.store is None:
+            return len(self.tokenizer.encode(content))
+
+        key = hashlib.sha1(content.encode("utf-8")).hexdigest()
+        n_tokens = self.store.get_cache("tokens", key)
+        if n_tokens is None:
+            n_tokens = len(self.tokenizer.encode(content))
+            self.store.put_cache("tokens", key, n_tokens)
+        return n_tokens
+
     def print_stream(self, _ai_response):
         """
         Helper function to print streaming responses from the AI model.
@@ -129,18 +222,19 @@ class OCIGenaiMagics(Magics):
         # return the entire result to be stored in history
         return all_chunks
 
-    def handle_input(self, messages, last_request):
+    def handle_input(self, messages, last_request, stage):
         """
         Process user input and send it to the AI model.
 
         Args:
             messages (list): A list of message objects to send to the AI model.
             last_request (str): The user's latest input.
+            stage (str): The magic command, used to route the request.
 
         Returns:
             None
         """
-        llm = get_llm()
+        model_id, llm = get_routed_llm(stage, messages, last_request)
 
         time_start = time()
 
@@ -149,19 +243,18 @@ class OCIGenaiMagics(Magics):
         all_text = self.print_stream(ai_response)
 
         # update stats
-        self.update_stats((time() - time_start), messages, all_text)
+        self.update_stats(model_id, (time() - time_start), messages, all_text)
 
         # save in history input and output
-        self.history.append(HumanMessage(content=last_request))
-        self.history.append(AIMessage(content=all_text))
+        self.add_to_history(last_request, all_text)
 
-    def handle_input_code(self, messages, last_request):
+    def handle_input_code(self, messages, last_request, stage="ask_code"):
         """
         Process input from the user to generate code and dynamically update a new cell.
         """
         print("Generating code...")
 
-        llm = get_llm()
+        model_id, llm = get_routed_llm(stage, messages, last_request)
 
         time_start = time()
 
@@ -174,11 +267,12 @@ class OCIGenaiMagics(Magics):
         shell.set_next_input(_code, replace=False)
 
         # update stats
-        self.update_stats((time() - time_start), messages, ai_response.content)
+        self.update_stats(
+            model_id, (time() - time_start), messages, ai_response.content
+        )
 
         # Save in history input and output
-        self.history.append(HumanMessage(content=last_request))
-        self.history.append(AIMessage(content=_code))
+        self.add_to_history(last_request, _code)
 
     @line_magic
     def clear_history(self, line):
@@ -189,6 +283,8 @@ class OCIGenaiMagics(Magics):
             line (str): Additional arguments (unused).
         """
         self.history = []
+        if self.store is not None:
+            self.store.clear_history()
         logger.info("History cleared !")
 
     @line_magic
@@ -204,6 +300,9 @@ class OCIGenaiMagics(Magics):
         # to compute genai resp.time
         self.genai_requests = 0
         self.genai_total_time = 0
+        self.model_stats = {}
+        clear_routing_stats()
+        self.save_stats()
         logger.info("Stats cleared !")
 
     @line_magic
@@ -222,7 +321,7 @@ class OCIGenaiMagics(Magics):
 
         # send the messages to the model and print the response
         # we send separately line to save in history user request
-        self.handle_input(messages, line)
+        self.handle_input(messages, line, "ask")
 
     @cell_magic
     def ask_code(self, line, cell):
@@ -233,7 +332,7 @@ class OCIGenaiMagics(Magics):
             line (str): The user's request for code.
         """
         # get the variables in session
-        context = get_context(self.shell.user_ns, cell)
+        context = get_context(self.shell.user_ns, cell, self.prefetcher)
         # build input to the model
         messages = [
             SystemMessage(content=PROMPT_ASK_CODE),
@@ -251,7 +350,7 @@ class OCIGenaiMagics(Magics):
         Args:
             line (str): The user's request for data analysis.
         """
-        context = get_context(self.shell.user_ns, cell)
+        context = get_context(self.shell.user_ns, cell, self.prefetcher)
 
         # print(f"\nContext: {context}\n\n")
 
@@ -262,7 +361,58 @@ class OCIGenaiMagics(Magics):
             HumanMessage(content=f"Context: {context}\n\n{cell}"),
         ]
         # send the messages to the model and print the response
-        self.handle_input(messages, cell)
+        self.handle_input(messages, cell, "ask_data")
+
+    @line_magic
+    def prefetch_context(self, line):
+        """
+        Enable, disable or show the status of the speculative prefetch of the context.
+
+        Args:
+            line (str): on | off | status (default: status)
+        """
+        command = line.strip().lower() or "status"
+
+        if command == "on":
+            self.prefetcher.start()
+        elif command == "off":
+            self.prefetcher.stop()
+        elif command == "status":
+            print("Context prefetch:")
+            print("* Enabled: ", self.prefetcher.enabled)
+            for name, value in self.prefetcher.stats().items():
+                print(f"* {name.capitalize().replace('_', ' ')}: ", value)
+        else:
+            print("Usage: %prefetch_context on|off|status")
+
+    @line_magic
+    def session_store(self, line):
+        """
+        Show the status of the session store, or compact it.
+
+        Args:
+            line (str): status | compact (default: status)
+        """
+        if self.store is None:
+            print("Session store not enabled (see SESSION_STORE_ENABLED in config.py)")
+            return
+
+        command = line.strip().lower() or "status"
+
+        if command == "compact":
+            self.store.compact()
+            self.store.flush()
+            logger.info("Session store compacted !")
+        elif command == "status":
+            print("Session store:")
+            print("* Path: ", self.store.path)
+            print("* Session: ", self.store.session)
+            print("* Messages in history: ", len(self.store.history))
+            print("* Rows in log: ", self.store.n_rows)
+            for namespace, cache in self.store.caches.items():
+                print(f"* Cache {namespace}: ", len(cache))
+        else:
+            print("Usage: %session_store status|compact")
 
     @line_magic
     def show_variables(self, line):
@@ -289,11 +439,17 @@ class OCIGenaiMagics(Magics):
             line (str): Additional arguments (unused).
         """
         print("Model configuration defined in config.py:")
-        print("* Model: ", MODEL_ID)
         print("* Endpoint: ", SERVICE_ENDPOINT)
-        print("* Temperature: ", TEMPERATURE)
-        print("* Top_p: ", TOP_P)
-        print("* Max_tokens: ", MAX_TOKENS)
+        for profile, model_profile in MODEL_PROFILES.items():
+            default = " (default)" if profile == DEFAULT_PROFILE else ""
+            print(f"* Profile {profile}{default}:")
+            print("  * Model: ", model_profile["model_id"])
+            print("  * Temperature: ", model_profile["temperature"])
+            print("  * Top_p: ", model_profile["top_p"])
+            print("  * Max_tokens: ", model_profile["max_tokens"])
+        print("* Routing enabled: ", ROUTING_ENABLED)
+        for stage, profile in ROUTES.items():
+            print(f"  * {stage}: ", profile)
 
     @line_magic
     def genai_stats(self, line):
@@ -318,6 +474,27 @@ class OCIGenaiMagics(Magics):
                 round(self.tokens_output / self.genai_requests, 1),
             )
 
+        print("Metrics by model:")
+        for model_id, _stats in self.model_stats.items():
+            print(f"* {model_id}:")
+            print("  * Requests: ", _stats["requests"])
+            print(
+                "  * Avg resp. time (sec.): ",
+                round(_stats["total_time"] / _stats["requests"], 2),
+            )
+            print("  * Input tokens: ", _stats["tokens_input"])
+            print("  * Output tokens: ", _stats["tokens_output"])
+
+        print("Routing decisions:")
+        for (stage, profile, reason), count in sorted(get_routing_stats().items()):
+            print(f"* {stage} -> {profile} ({reason}): ", count)
+
+        print("Resilience metrics:")
+        for profile, _stats in get_resilient_stats().items():
+            print(f"* {profile}:")
+            for name, value in _stats.items():
+                print(f"  * {name.capitalize().replace('_', ' ')}: ", value)
+
 
 def load_ipython_extension(ipython):
     """
@@ -337,6 +514,8 @@ def load_ipython_extension(ipython):
         "clear_history",
         "genai_stats",
         "clear_stats",
+        "prefetch_context",
+        "session_store",
     ]
     print("List of magic commands available:")
     for command in command_list:
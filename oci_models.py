@@ -2,36 +2,80 @@
 Functions to access to OCI Genai models
 """
 
+import oci
 from langchain_community.chat_models import ChatOCIGenAI
 
 from config import (
-    MODEL_ID,
     AUTH,
     SERVICE_ENDPOINT,
-    MAX_TOKENS,
-    TEMPERATURE,
-    TOP_P,
     COMPARTMENT_ID,
+    MODEL_PROFILES,
+    DEFAULT_PROFILE,
+    LLM_TIMEOUT,
 )
 
+# connect and read timeout (sec.) of the OCI client
+# (the defaults in ChatOCIGenAI are 10 and 240)
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = min(240, LLM_TIMEOUT)
 
-def get_llm():
+
+def get_client():
+    """
+    Create the OCI GenAI inference client, without the SDK retries.
+
+    Retries and throttling are done in resilient_llm.py: with the SDK retries too,
+    a call timed out there would keep retrying in the background for minutes,
+    while a new call is already sent. The read timeout is at most LLM_TIMEOUT,
+    so the threads of the calls timed out end.
+
+    Returns:
+        GenerativeAiInferenceClient: the OCI client.
+    """
+    client_kwargs = {
+        "config": {},
+        "service_endpoint": SERVICE_ENDPOINT,
+        "retry_strategy": oci.retry.NoneRetryStrategy(),
+        "timeout": (CONNECT_TIMEOUT, READ_TIMEOUT),
+    }
+
+    if AUTH == "API_KEY":
+        client_kwargs["config"] = oci.config.from_file()
+    elif AUTH == "INSTANCE_PRINCIPAL":
+        client_kwargs["signer"] = (
+            oci.auth.signers.InstancePrincipalsSecurityTokenSigner()
+        )
+    elif AUTH == "RESOURCE_PRINCIPAL":
+        client_kwargs["signer"] = oci.auth.signers.get_resource_principals_signer()
+    else:
+        raise ValueError(f"Auth type not supported: {AUTH}")
+
+    return oci.generative_ai_inference.GenerativeAiInferenceClient(**client_kwargs)
+
+
+def get_llm(profile: str = DEFAULT_PROFILE):
     """
     Initialize and return an instance of ChatOCIGenAI with the specified configuration.
 
+    Args:
+        profile (str): the name of the model profile (see MODEL_PROFILES in config.py).
+
     Returns:
         ChatOCIGenAI: An instance of the OCI GenAI language model.
     """
+    model_profile = MODEL_PROFILES[profile]
+
     llm = ChatOCIGenAI(
+        client=get_client(),
         auth_type=AUTH,
-        model_id=MODEL_ID,
+        model_id=model_profile["model_id"],
         service_endpoint=SERVICE_ENDPOINT,
         compartment_id=COMPARTMENT_ID,
         is_stream=True,
         model_kwargs={
-            "temperature": TEMPERATURE,
-            "max_tokens": MAX_TOKENS,
-            "top_p": TOP_P,
+            "temperature": model_profile["temperature"],
+            "max_tokens": model_profile["max_tokens"],
+            "top_p": model_profile["top_p"],
         },
     )
     return llm
@@ -0,0 +1,320 @@
+"""
+Speculative prefetch of the data context.
+
+After each executed cell (IPython post_run_cell event) the DataFrames
+that have been created or modified are summarized in a background thread,
+so that %%ask_data / %%ask_code can reuse the summary instead of
+building it while the user is waiting.
+"""
+
+import os
+import re
+import ast
+import sys
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from typing import Any, Dict, Optional
+from pandas.util import hash_pandas_object
+
+from context import filter_variables, get_variable_info
+from config import (
+    PREFETCH_FINGERPRINT_ROWS,
+    PREFETCH_MAX_WORKERS,
+    PREFETCH_MAX_PER_CELL,
+    PREFETCH_MAX_DF_BYTES,
+    PREFETCH_MAX_CACHE_CHARS,
+    PREFETCH_THREAD_NICE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def is_dataframe(value: Any) -> bool:
+    """
+    Check if the value is a DataFrame (same test used in context.py)
+    """
+    return "DataFrame" in str(type(value))
+
+
+def _content_hash(value: Any) -> int:
+    """
+    Hash of the first and last rows of a DataFrame (cheap content check)
+    """
+    head_tail = value.iloc[:PREFETCH_FINGERPRINT_ROWS]
+    if len(value) > PREFETCH_FINGERPRINT_ROWS:
+        head_tail = value.iloc[
+            [*range(PREFETCH_FINGERPRINT_ROWS), *range(-PREFETCH_FINGERPRINT_ROWS, 0)]
+        ]
+    try:
+        return hash(hash_pandas_object(head_tail, index=True).values.tobytes())
+    except TypeError:
+        # unhashable values (lists, dicts) in some columns
+        return hash(repr(head_tail.values.tolist()))
+
+
+def fingerprint(value: Any) -> tuple:
+    """
+    Compute a cheap fingerprint of a DataFrame.
+
+    Only the first and last rows are looked at, so in-place changes are also
+    detected looking at the names used in the executed cell (see post_run_cell).
+    """
+    return (
+        id(value),
+        value.shape,
+        tuple(str(col) for col in value.columns),
+        tuple(str(dtype) for dtype in value.dtypes),
+        _content_hash(value),
+    )
+
+
+def names_in_code(code: str) -> set:
+    """
+    Return the names (ast.Name nodes) used in the code,
+    for example df in df["a"] = 1 or df.fillna(0, inplace=True)
+    """
+    try:
+        return {
+            node.id for node in ast.walk(ast.parse(code)) if isinstance(node, ast.Name)
+        }
+    except SyntaxError:
+        # be conservative: all the identifiers
+        return set(re.findall(r"[A-Za-z_][A-Za-z0-9_]*", code))
+
+
+def _lower_thread_priority():
+    """
+    Lower the priority of the worker thread, to avoid competing with the user's code.
+    On Linux the nice value is per thread, elsewhere this is a no-op.
+    """
+    if not sys.platform.startswith("linux") or PREFETCH_THREAD_NICE <= 0:
+        return
+    try:
+        os.setpriority(
+            os.PRIO_PROCESS, threading.get_native_id(), PREFETCH_THREAD_NICE
+        )
+    except (AttributeError, OSError):
+        pass
+
+
+class ContextPrefetcher:
+    """
+    Precompute and cache the summaries (get_variable_info) of the DataFrames
+    recently created or modified in the user's namespace.
+    """
+
+    def __init__(self, shell):
+        """
+        Initialize a new instance of ContextPrefetcher.
+
+        Args:
+            shell (InteractiveShell): the IPython shell to observe.
+        """
+        self.shell = shell
+        self.enabled = False
+
+        self._executor = None
+        self._lock = threading.Lock()
+        # name -> (fingerprint, info), in LRU order
+        self._cache = OrderedDict()
+        self._cache_chars = 0
+        # name -> (fingerprint, generation, future)
+        self._pending = {}
+        self._generation = 0
+        # last fingerprint seen for each DataFrame in the namespace
+        self._seen = {}
+
+        # stats
+        self.hits = 0
+        self.misses = 0
+
+    def start(self):
+        """
+        Start observing the executed cells.
+        """
+        if self.enabled:
+            return
+        self._executor = ThreadPoolExecutor(
+            max_workers=PREFETCH_MAX_WORKERS,
+            thread_name_prefix="context-prefetch",
+            initializer=_lower_thread_priority,
+        )
+        self.shell.events.register("post_run_cell", self.post_run_cell)
+        self.enabled = True
+        logger.info("Context prefetch enabled !")
+
+    def stop(self):
+        """
+        Stop observing the executed cells, cancel pending work and drop the cache.
+        """
+        if not self.enabled:
+            return
+        self.shell.events.unregister("post_run_cell", self.post_run_cell)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self.enabled = False
+
+        with self._lock:
+            self._pending.clear()
+            self._cache.clear()
+            self._cache_chars = 0
+        self._seen.clear()
+        logger.info("Context prefetch disabled !")
+
+    def post_run_cell(self, result):
+        """
+        Handler for the IPython post_run_cell event.
+
+        Schedule the summary of the DataFrames created or modified by the cell.
+        A DataFrame is considered modified if its fingerprint has changed
+        or if its name is referenced in the source of the cell.
+        """
+        raw_cell = getattr(getattr(result, "info", None), "raw_cell", None) or ""
+        # translate magics and shell escapes to python, to be able to parse the cell
+        transform_cell = getattr(self.shell, "transform_cell", None)
+        if transform_cell is not None:
+            raw_cell = transform_cell(raw_cell)
+        names_in_cell = names_in_code(raw_cell)
+
+        dataframes = {
+            name: value
+            for name, value in filter_variables(self.shell.user_ns).items()
+            if is_dataframe(value)
+        }
+
+        # forget the DataFrames deleted from the namespace
+        for name in list(self._seen):
+            if name not in dataframes:
+                del self._seen[name]
+                self._invalidate(name)
+
+        n_scheduled = 0
+        for name, value in dataframes.items():
+            _fp = fingerprint(value)
+
+            if self._seen.get(name) == _fp and name not in names_in_cell:
+                continue
+            self._seen[name] = _fp
+
+            self._invalidate(name)
+
+            if n_scheduled >= PREFETCH_MAX_PER_CELL:
+                continue
+            if value.memory_usage(deep=False).sum() > PREFETCH_MAX_DF_BYTES:
+                # too big, it would compete with the user's code
+                continue
+
+            self._schedule(name, value, _fp)
+            n_scheduled += 1
+
+    def get(self, name: str, value: Any) -> Optional[str]:
+        """
+        Return the prefetched summary for the variable, or None if not available.
+
+        If the summary is being computed for the same version of the DataFrame,
+        wait for it: it is never slower than starting from scratch. If it is still
+        queued (behind other DataFrames), cancel it: the caller computes it inline.
+        """
+        if not self.enabled or not is_dataframe(value):
+            return None
+
+        _fp = fingerprint(value)
+
+        with self._lock:
+            entry = self._cache.get(name)
+            if entry is not None and entry[0] == _fp:
+                self._cache.move_to_end(name)
+                self.hits += 1
+                return entry[1]
+            pending = self._pending.get(name)
+
+        if pending is not None and pending[0] == _fp:
+            # cancel fails if the computation is already running (or done)
+            if pending[2].cancel():
+                with self._lock:
+                    if self._pending.get(name) is pending:
+                        del self._pending[name]
+                    self.misses += 1
+                return None
+            try:
+                info = pending[2].result()
+                with self._lock:
+                    self.hits += 1
+                return info
+            except (CancelledError, Exception):
+                pass
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return the prefetch statistics.
+        """
+        with self._lock:
+            return {
+                "cached": len(self._cache),
+                "cached_chars": self._cache_chars,
+                "pending": len(self._pending),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _invalidate(self, name: str):
+        """
+        Cancel the pending work and drop the cached summary for the variable.
+        """
+        with self._lock:
+            pending = self._pending.pop(name, None)
+            entry = self._cache.pop(name, None)
+            if entry is not None:
+                self._cache_chars -= len(entry[1])
+        if pending is not None:
+            # if already running, the result is discarded in _store
+            pending[2].cancel()
+
+    def _schedule(self, name: str, value: Any, _fp: tuple):
+        """
+        Submit the computation of the summary to the worker thread.
+        """
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            future = self._executor.submit(get_variable_info, name, value)
+            self._pending[name] = (_fp, generation, future)
+
+        future.add_done_callback(
+            lambda _future: self._store(name, _fp, generation, _future)
+        )
+
+    def _store(self, name: str, _fp: tuple, generation: int, future):
+        """
+        Store the computed summary, unless it has been superseded in the meantime.
+        """
+        if future.cancelled():
+            return
+        try:
+            info = future.result()
+        except Exception as e:
+            logger.warning("Context prefetch failed for %s: %s", name, e)
+            return
+
+        with self._lock:
+            pending = self._pending.get(name)
+            if pending is None or pending[1] != generation:
+                # the variable has changed again
+                return
+            del self._pending[name]
+
+            if len(info) > PREFETCH_MAX_CACHE_CHARS:
+                return
+            self._cache[name] = (_fp, info)
+            self._cache_chars += len(info)
+
+            # evict the least recently used summaries
+            while self._cache_chars > PREFETCH_MAX_CACHE_CHARS:
+                _, (_, old_info) = self._cache.popitem(last=False)
+                self._cache_chars -= len(old_info)
@@ -67,3 +67,39 @@ def calculate_mean(numbers):
     return sum(numbers) / len(numbers)
 
 """
+
+PROMPT_ASK_CODE_LARGE_FILE = """
+You are an expert Data Scientist proficient in Python programming.
+
+Task:
+- Generate Python code to accomplish the user's request on a CSV file too big to be loaded in memory.
+
+Instructions:
+- The context describes a sample of the file: the full file has the same columns.
+- The variables file_path (the path of the CSV file) and chunksize (number of rows) are already defined.
+- Never load the entire file: read it in chunks with pd.read_csv(file_path, chunksize=chunksize).
+- Use usecols to read only the columns needed.
+- Compute the results incrementally: keep only small aggregates between chunks
+  (sums, counts, min/max, partial group-by results, top-k candidates) and combine them at the end.
+- Print the results, with an appropriate and meaningful header.
+
+Constraints:
+- Provide only the Python code in your response, don't add any comments.
+- Use only pandas and standard Python libraries.
+- Do not use external APIs or access the internet.
+
+Example Input:
+- User request: "Compute the average price by city."
+
+Example Output:
+
+sums = None
+counts = None
+for chunk in pd.read_csv(file_path, chunksize=chunksize, usecols=["city", "price"]):
+    grouped = chunk.groupby("city")["price"]
+    sums = grouped.sum() if sums is None else sums.add(grouped.sum(), fill_value=0)
+    counts = grouped.count() if counts is None else counts.add(grouped.count(), fill_value=0)
+print("Average price by city")
+print(sums / counts)
+
+"""
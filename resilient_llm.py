@@ -0,0 +1,364 @@
+"""
+Resilient call layer for OCI GenAI models
+
+- timeout on every call
+- retries with exponential backoff and (full) jitter
+- rate-limit aware throttling: after a 429 all the calls wait for the cooldown
+- optional hedged requests: if a call is slower than the p95 of the recent
+  latencies, a second identical call is fired and the first answer wins
+
+for streaming calls timeout, retries and hedging apply to the first chunk:
+once the output has started to flow it cannot be retried.
+"""
+
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+from oci_models import get_llm
+from config import (
+    DEFAULT_PROFILE,
+    LLM_TIMEOUT,
+    LLM_MAX_RETRIES,
+    LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX,
+    LLM_HEDGE_REQUESTS,
+    LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_LATENCY_WINDOW,
+)
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes worth a retry
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+STATUS_TOO_MANY_REQUESTS = 429
+
+
+def get_status(exc: Exception):
+    """
+    Return the HTTP status of the error (oci.exceptions.ServiceError has it), or None
+    """
+    return getattr(exc, "status", None)
+
+
+def is_retryable(exc: Exception) -> bool:
+    """
+    Check if the call that raised the exception can be retried
+    """
+    # timeouts, connection errors (requests' exceptions are OSError too)
+    if isinstance(exc, (TimeoutError, OSError)):
+        return True
+    return get_status(exc) in RETRYABLE_STATUS
+
+
+def get_retry_after(exc: Exception) -> float:
+    """
+    Return the delay (sec.) requested by the service in the retry-after header, or 0
+    """
+    headers = getattr(exc, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def percentile(values, perc: float) -> float:
+    """
+    Compute the percentile (nearest rank) of the values
+    """
+    _sorted = sorted(values)
+    index = max(0, int(round(perc / 100 * len(_sorted))) - 1)
+    return _sorted[min(index, len(_sorted) - 1)]
+
+
+def _first_chunk(llm, messages):
+    """
+    Start the stream and wait for the first chunk.
+    Return the first chunk (None if the stream is empty) and the iterator.
+    """
+    iterator = iter(llm.stream(messages))
+    return next(iterator, None), iterator
+
+
+def _close_stream(result):
+    """
+    Close the iterator of a stream not used (it releases the HTTP response)
+    """
+    close = getattr(result[1], "close", None)
+    if close is not None:
+        close()
+
+
+def _submit(func) -> Future:
+    """
+    Run func in a new (daemon) thread and return its Future.
+
+    A thread for each call, instead of a pool: calls hanging after a timeout
+    must not hold the workers needed by the new requests.
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func())
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="genai-call", daemon=True).start()
+    return future
+
+
+class ResilientLLM:
+    """
+    Wrap a chat model (anything with invoke and stream) adding
+    timeout, retries, throttling and hedged requests.
+    """
+
+    def __init__(
+        self,
+        llm_factory,
+        timeout=LLM_TIMEOUT,
+        max_retries=LLM_MAX_RETRIES,
+        backoff_base=LLM_BACKOFF_BASE,
+        backoff_max=LLM_BACKOFF_MAX,
+        hedge=LLM_HEDGE_REQUESTS,
+    ):
+        """
+        Initialize a new instance of ResilientLLM.
+
+        Args:
+            llm_factory (callable): returns the chat model to wrap (for example get_llm).
+            timeout (float): max time (sec.) for a call (first chunk for stream).
+            max_retries (int): max number of retries after the first attempt.
+            backoff_base (float): base delay (sec.) for the exponential backoff.
+            backoff_max (float): max delay (sec.) between two attempts.
+            hedge (bool): enable hedged requests.
+        """
+        self.llm = llm_factory()
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+
+        # calls are done in worker threads (see _submit), to enforce the timeout
+        # a call timed out can't be killed: its thread is simply abandoned
+        self._lock = threading.Lock()
+        # no calls before this time (set after a 429)
+        self._throttled_until = 0.0
+        # recent latencies, to decide when to hedge
+        self._latencies = {
+            "invoke": deque(maxlen=LLM_LATENCY_WINDOW),
+            "stream": deque(maxlen=LLM_LATENCY_WINDOW),
+        }
+
+        # stats
+        self.n_calls = 0
+        self.n_retries = 0
+        self.n_timeouts = 0
+        self.n_throttled = 0
+        self.n_hedged = 0
+        self.n_hedge_wins = 0
+
+    def invoke(self, messages):
+        """
+        Call the model and return the complete response.
+        """
+        return self._call_with_retries(
+            lambda: self.llm.invoke(messages), self._latencies["invoke"]
+        )
+
+    def stream(self, messages):
+        """
+        Call the model and return a generator yielding the chunks of the response.
+        """
+        first, iterator = self._call_with_retries(
+            lambda: _first_chunk(self.llm, messages),
+            self._latencies["stream"],
+            discard=_close_stream,
+        )
+        if first is None:
+            return
+        yield first
+        yield from iterator
+
+    def hedge_delay(self, latencies):
+        """
+        Return the delay after which a hedged request is fired, or None if not enabled
+        """
+        if not self.hedge or len(latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        # hedging doubles the load: not while the service is throttling us
+        if time.time() < self._throttled_until:
+            return None
+        return percentile(latencies, LLM_HEDGE_PERCENTILE)
+
+    def stats(self):
+        """
+        Return the stats of the calls
+        """
+        stats = {
+            "calls": self.n_calls,
+            "retries": self.n_retries,
+            "timeouts": self.n_timeouts,
+            "throttled": self.n_throttled,
+            "hedged": self.n_hedged,
+            "hedge_wins": self.n_hedge_wins,
+        }
+        for name, latencies in self._latencies.items():
+            if latencies:
+                stats[f"{name}_p95_latency"] = round(percentile(latencies, 95), 3)
+        return stats
+
+    def _wait_throttle(self):
+        """
+        Wait until the cooldown after a 429 has expired
+        """
+        delay = self._throttled_until - time.time()
+        if delay > 0:
+            logger.info("Rate limited, waiting %.1f sec. ...", delay)
+            time.sleep(delay)
+
+    def _backoff(self, attempt: int) -> float:
+        """
+        Exponential backoff with full jitter
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def _call_with_retries(self, func, latencies, discard=None):
+        """
+        Call func, retrying the retryable errors with backoff
+        """
+        attempt = 0
+
+        while True:
+            self._wait_throttle()
+            try:
+                return self._call_with_hedge(func, latencies, discard)
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+
+                delay = self._backoff(attempt)
+                if get_status(e) == STATUS_TOO_MANY_REQUESTS:
+                    delay = max(delay, get_retry_after(e))
+                    with self._lock:
+                        self.n_throttled += 1
+                        self._throttled_until = max(
+                            self._throttled_until, time.time() + delay
+                        )
+
+                attempt += 1
+                with self._lock:
+                    self.n_retries += 1
+                logger.warning(
+                    "GenAI call failed (%s), retry %d/%d in %.1f sec. ...",
+                    e,
+                    attempt,
+                    self.max_retries,
+                    delay,
+                )
+                time.sleep(delay)
+
+    def _call_with_hedge(self, func, latencies, discard=None):
+        """
+        Call func with timeout; if hedging is enabled and the call is slower
+        than the p95, fire a second call and return the first answer.
+
+        discard is applied to the results not used (losing or timed-out calls),
+        as soon as they are available.
+        """
+        with self._lock:
+            self.n_calls += 1
+
+        time_start = time.time()
+        deadline = time_start + self.timeout
+
+        primary = _submit(func)
+        futures = {primary}
+
+        _hedge_delay = self.hedge_delay(latencies)
+        if _hedge_delay is not None and _hedge_delay < self.timeout:
+            done, _ = wait(futures, timeout=_hedge_delay)
+            if not done:
+                with self._lock:
+                    self.n_hedged += 1
+                futures.add(_submit(func))
+
+        error = None
+        while futures:
+            done, futures = wait(
+                futures,
+                timeout=max(0, deadline - time.time()),
+                return_when=FIRST_COMPLETED,
+            )
+            if not done:
+                break
+
+            for future in done:
+                if future.exception() is None:
+                    latencies.append(time.time() - time_start)
+                    if future is not primary:
+                        with self._lock:
+                            self.n_hedge_wins += 1
+                    self._discard_others(future, done | futures, discard)
+                    return future.result()
+                error = future.exception()
+            # all the calls done have failed, wait for the others (if any)
+
+        if error is not None and not futures:
+            raise error
+
+        self._discard_others(None, futures, discard)
+
+        with self._lock:
+            self.n_timeouts += 1
+        # a timed-out call counts as a slow one
+        latencies.append(self.timeout)
+        raise TimeoutError(f"GenAI call timed out after {self.timeout} sec.")
+
+    @staticmethod
+    def _discard_others(winner, futures, discard):
+        """
+        Apply discard to the results of all the futures but the winner,
+        now or when they complete
+        """
+        if discard is None:
+            return
+
+        def _discard(future):
+            if not future.cancelled() and future.exception() is None:
+                discard(future.result())
+
+        for future in futures:
+            if future is not winner:
+                future.add_done_callback(_discard)
+
+
+# one instance for each model profile, to share latencies and throttling
+_INSTANCES = {}
+_INSTANCES_LOCK = threading.Lock()
+
+
+def get_resilient_llm(profile: str = DEFAULT_PROFILE):
+    """
+    Return the (shared) ResilientLLM for the model profile.
+    """
+    with _INSTANCES_LOCK:
+        if profile not in _INSTANCES:
+            _INSTANCES[profile] = ResilientLLM(lambda: get_llm(profile))
+        return _INSTANCES[profile]
+
+
+def get_resilient_stats():
+    """
+    Return the stats of the calls, for each model profile used
+    """
+    with _INSTANCES_LOCK:
+        return {profile: llm.stats() for profile, llm in _INSTANCES.items()}
@@ -0,0 +1,219 @@
+"""
+Cache for csv_analyzer results
+
+- the key is (data fingerprint, hash of the normalized code AST)
+- stores the captured output of the code and the final answers
+- remembers the code generated for a question on the same data,
+  so repeated questions don't call the LLM at all
+- eviction by size (entries and bytes) and by age
+"""
+
+import os
+import ast
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+from pandas.util import hash_pandas_object
+
+from config import (
+    RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_MAX_BYTES,
+    RESULT_CACHE_MAX_AGE,
+)
+
+
+def file_fingerprint(file) -> str:
+    """
+    Fingerprint of a file, from path, size and modification time (without reading it)
+    """
+    stat = os.stat(file)
+    key = f"{os.path.realpath(file)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def dataframe_fingerprint(df) -> Optional[str]:
+    """
+    Fingerprint of the content of a DataFrame (columns, dtypes and data),
+    or None if it can't be computed (then the result is not cached)
+    """
+    digest = hashlib.sha256()
+    digest.update(repr(list(df.columns)).encode("utf-8"))
+    digest.update(repr([str(dtype) for dtype in df.dtypes]).encode("utf-8"))
+    try:
+        digest.update(hash_pandas_object(df, index=True).values.tobytes())
+    except TypeError:
+        # unhashable values (lists, dicts), for example after json_normalize
+        try:
+            digest.update(df.to_csv().encode("utf-8"))
+        except Exception:
+            return None
+    return digest.hexdigest()
+
+
+def code_hash(code: str) -> str:
+    """
+    Hash of the code, normalized through the AST (formatting and comments don't count)
+    """
+    try:
+        normalized = ast.dump(ast.parse(code))
+    except SyntaxError:
+        normalized = "\n".join(line.strip() for line in code.splitlines() if line.strip())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize the whitespace of the question
+    (not the case: it can matter, for example in column names)
+    """
+    return " ".join(question.split())
+
+
+class ResultCache:
+    """
+    LRU cache of the results of csv_analyzer, bounded by size and age.
+    """
+
+    def __init__(
+        self,
+        max_entries=RESULT_CACHE_MAX_ENTRIES,
+        max_bytes=RESULT_CACHE_MAX_BYTES,
+        max_age=RESULT_CACHE_MAX_AGE,
+    ):
+        """
+        Initialize a new instance of ResultCache.
+
+        Args:
+            max_entries (int): max number of entries.
+            max_bytes (int): max total size (chars) of the entries.
+            max_age (float): max age (sec.) of an entry.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self._lock = threading.Lock()
+        # key -> [timestamp, size, value], in LRU order
+        # keys are ("code", data_fp, question) -> code
+        # and ("result", data_fp, code hash) -> {"output": ..., "answers": {question: ...}}
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+        # stats
+        self.hits = 0
+        self.misses = 0
+
+    def get_code(self, data_fp: str, question: str) -> Optional[str]:
+        """
+        Return the code generated for the question on the same data, or None
+        """
+        return self._get(("code", data_fp, normalize_question(question)))
+
+    def put_code(self, data_fp: str, question: str, code: str):
+        """
+        Store the code generated for the question
+        """
+        self._put(("code", data_fp, normalize_question(question)), code, len(code))
+
+    def get_output(self, data_fp: str, code: str) -> Optional[str]:
+        """
+        Return the captured output of the code on the same data, or None
+        """
+        result = self._get(("result", data_fp, code_hash(code)))
+        return None if result is None else result["output"]
+
+    def put_output(self, data_fp: str, code: str, output: str):
+        """
+        Store the captured output of the code
+        """
+        self._put(
+            ("result", data_fp, code_hash(code)),
+            {"output": output, "answers": {}},
+            len(output),
+        )
+
+    def get_answer(self, data_fp: str, code: str, question: str) -> Optional[str]:
+        """
+        Return the final answer to the question, or None
+        """
+        result = self._get(("result", data_fp, code_hash(code)))
+        if result is None:
+            return None
+        return result["answers"].get(normalize_question(question))
+
+    def put_answer(self, data_fp: str, code: str, question: str, answer: str):
+        """
+        Store the final answer to the question (the output must be already stored)
+        """
+        key = ("result", data_fp, code_hash(code))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry[2]["answers"][normalize_question(question)] = answer
+            entry[1] += len(answer)
+            self._bytes += len(answer)
+            self._evict()
+
+    def clear(self):
+        """
+        Remove all the entries
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Return the stats of the cache
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.max_age:
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def _put(self, key, value, size: int):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = [time.time(), size, value]
+            self._bytes += size
+            self._evict()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[1]
+
+    def _evict(self):
+        """
+        Drop the expired entries, then the least recently used until within limits
+        """
+        now = time.time()
+        for key in [k for k, e in self._entries.items() if now - e[0] > self.max_age]:
+            self._remove(key)
+
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            key = next(iter(self._entries))
+            self._remove(key)
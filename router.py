@@ -0,0 +1,110 @@
+"""
+Routing of the requests to the model profiles
+
+- each magic / csv_analyzer stage has a profile (ROUTES in config.py)
+- a request routed to the fast model is escalated to the large one
+  if the prompt is big or the question looks complex (contains or asks for code)
+- routing decisions are recorded, to be shown in %genai_stats
+"""
+
+import re
+import threading
+from collections import Counter
+
+from resilient_llm import get_resilient_llm
+from config import (
+    MODEL_PROFILES,
+    DEFAULT_PROFILE,
+    ROUTING_ENABLED,
+    ROUTES,
+    ROUTING_MAX_FAST_TOKENS,
+)
+
+# requests to write or fix code, for example "write a function" or "fix my code".
+# Not single words: error, function and so on are common in data science questions
+CODE_REQUEST = re.compile(
+    r"\b(write|fix|debug|refactor|implement|generate|create|correct)\b"
+    r"(\W+\w+){0,4}?\W+(code|function|script|class|program|snippet)s?\b",
+    re.IGNORECASE,
+)
+# code pasted in the question
+CODE_MARKERS = ("```", "\ndef ", "import ", "Traceback (most recent call last)")
+
+# (stage, profile, reason) -> count
+_DECISIONS = Counter()
+_DECISIONS_LOCK = threading.Lock()
+
+
+def estimate_tokens(messages) -> int:
+    """
+    Cheap estimate of the #of tokens of the messages (4 chars per token)
+    """
+    return sum(len(str(getattr(msg, "content", msg) or "")) for msg in messages) // 4
+
+
+def is_complex(text: str) -> bool:
+    """
+    Check if the question looks complex: it contains code or asks for it
+    """
+    if any(marker in text for marker in CODE_MARKERS):
+        return True
+    return CODE_REQUEST.search(text) is not None
+
+
+def route(stage: str, messages, question: str = None) -> tuple:
+    """
+    Choose the model profile for the request.
+
+    Args:
+        stage (str): the magic or csv_analyzer stage (a key of ROUTES).
+        messages (list): the messages to send to the model.
+        question (str): the user's question, checked for complexity
+            (default: the last message).
+
+    Returns:
+        tuple: the name of the profile and the reason of the choice.
+    """
+    if not ROUTING_ENABLED:
+        return DEFAULT_PROFILE, "routing disabled"
+
+    profile = ROUTES.get(stage, DEFAULT_PROFILE)
+    reason = "route"
+
+    if profile != DEFAULT_PROFILE:
+        if question is None:
+            # the last message is the user's request
+            question = str(getattr(messages[-1], "content", "")) if messages else ""
+
+        if estimate_tokens(messages) > ROUTING_MAX_FAST_TOKENS:
+            profile, reason = DEFAULT_PROFILE, "size"
+        elif is_complex(question):
+            profile, reason = DEFAULT_PROFILE, "complexity"
+
+    with _DECISIONS_LOCK:
+        _DECISIONS[(stage, profile, reason)] += 1
+
+    return profile, reason
+
+
+def get_routed_llm(stage: str, messages, question: str = None) -> tuple:
+    """
+    Route the request and return the model id and the (resilient) llm to use.
+    """
+    profile, _ = route(stage, messages, question)
+    return MODEL_PROFILES[profile]["model_id"], get_resilient_llm(profile)
+
+
+def get_routing_stats() -> dict:
+    """
+    Return the routing decisions: (stage, profile, reason) -> count
+    """
+    with _DECISIONS_LOCK:
+        return dict(_DECISIONS)
+
+
+def clear_routing_stats():
+    """
+    Clear the routing decisions
+    """
+    with _DECISIONS_LOCK:
+        _DECISIONS.clear()
@@ -0,0 +1,340 @@
+"""
+Persistent session store
+
+- keep history, stats and caches across kernel restarts
+- append-only log in a local SQLite db
+- the state is restored in memory at startup, then writes are asynchronous
+  (done by a background thread), so requests never wait on disk
+- compaction rewrites the log keeping only the current state
+- the notebooks in the same project share the db: the records of each one
+  are kept apart by a session column (the path of the notebook)
+"""
+
+import os
+import json
+import hashlib
+import time
+import queue
+import atexit
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import (
+    SESSION_STORE_DIR,
+    SESSION_STORE_PATH,
+    SESSION_STORE_MAX_MESSAGES,
+    SESSION_STORE_MAX_CACHE_ENTRIES,
+    SESSION_STORE_COMPACT_ROWS,
+)
+
+logger = logging.getLogger(__name__)
+
+# kinds of records in the log
+KIND_MESSAGE = "message"
+KIND_CLEAR_HISTORY = "clear_history"
+KIND_STATS = "stats"
+KIND_CACHE = "cache"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    session TEXT NOT NULL DEFAULT '',
+    kind TEXT NOT NULL,
+    namespace TEXT NOT NULL DEFAULT '',
+    key TEXT NOT NULL DEFAULT '',
+    value TEXT,
+    ts REAL NOT NULL
+)
+"""
+
+INDEX = "CREATE INDEX IF NOT EXISTS log_session ON log (session, seq)"
+
+INSERT = (
+    "INSERT INTO log (session, kind, namespace, key, value, ts) VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+
+def get_session_store_path(project_dir: Optional[str] = None) -> str:
+    """
+    Return the path of the db for the project, so that unrelated notebooks
+    don't share history.
+
+    Args:
+        project_dir (str): the project directory (default: the working directory,
+            that in Jupyter is the directory of the notebook).
+    """
+    if SESSION_STORE_PATH:
+        return SESSION_STORE_PATH
+
+    project_dir = os.path.realpath(project_dir or os.getcwd())
+    key = hashlib.sha1(project_dir.encode("utf-8")).hexdigest()[:12]
+    name = os.path.basename(project_dir) or "root"
+    return os.path.join(SESSION_STORE_DIR, f"{name}-{key}.db")
+
+
+def get_session_name(user_ns: Optional[dict] = None) -> str:
+    """
+    Return the identity of the notebook (its path), to keep its records apart
+    from the ones of the other notebooks in the same project.
+
+    Jupyter sets JPY_SESSION_NAME in the kernel environment,
+    ipykernel copies it in __session__ in the user namespace.
+    Outside Jupyter it is empty.
+    """
+    name = os.environ.get("JPY_SESSION_NAME")
+    if not name and user_ns is not None:
+        name = user_ns.get("__session__")
+    return name or ""
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    """
+    Open the db, in WAL mode (readers don't block the writer)
+    """
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(SCHEMA)
+    # dbs created before the session column
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(log)")]
+    if "session" not in columns:
+        conn.execute("ALTER TABLE log ADD COLUMN session TEXT NOT NULL DEFAULT ''")
+    conn.execute(INDEX)
+    return conn
+
+
+class SessionStore:
+    """
+    Local, append-only store for history, stats and caches.
+    """
+
+    def __init__(self, path: str, session: str = ""):
+        """
+        Open (or create) the store and restore the state.
+
+        Args:
+            path (str): the path of the SQLite db file.
+            session (str): the identity of the notebook (see get_session_name).
+        """
+        self.path = os.path.expanduser(path)
+        self.session = session
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+        # in-memory state
+        # list of (role, content)
+        self.history: List[Tuple[str, str]] = []
+        self.stats: Dict[str, Any] = {}
+        # namespace -> OrderedDict(key -> value), in LRU order
+        self.caches: Dict[str, OrderedDict] = {}
+        self.n_rows = 0
+        # last seq replayed or written by this store: compaction deletes
+        # only up to it, not the rows written meanwhile by another kernel
+        self._last_seq = 0
+
+        time_start = time.time()
+        self._restore()
+        logger.info(
+            "Session store restored in %.3f sec. (%d messages, %d rows)",
+            time.time() - time_start,
+            len(self.history),
+            self.n_rows,
+        )
+
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(
+            target=self._write_loop, name="session-store-writer", daemon=True
+        )
+        self._writer.start()
+        atexit.register(self.close)
+
+        if self.n_rows > SESSION_STORE_COMPACT_ROWS:
+            self.compact()
+
+    #
+    # public API, called from the main thread
+    #
+    def append_message(self, role: str, content: str):
+        """
+        Append a message (role is human or ai) to the history.
+        """
+        self.history.append((role, content))
+        del self.history[:-SESSION_STORE_MAX_MESSAGES]
+        self._enqueue(KIND_MESSAGE, "", role, content)
+
+    def clear_history(self):
+        """
+        Clear the history.
+        """
+        self.history = []
+        self._enqueue(KIND_CLEAR_HISTORY, "", "", None)
+
+    def save_stats(self, stats: Dict[str, Any]):
+        """
+        Save a snapshot of the stats.
+        """
+        self.stats = dict(stats)
+        self._enqueue(KIND_STATS, "", "", json.dumps(self.stats))
+
+    def get_cache(self, namespace: str, key: str) -> Optional[Any]:
+        """
+        Return the cached value, or None.
+        """
+        cache = self.caches.get(namespace)
+        if cache is None or key not in cache:
+            return None
+        cache.move_to_end(key)
+        return cache[key]
+
+    def put_cache(self, namespace: str, key: str, value: Any):
+        """
+        Add a value (JSON serializable) to the cache.
+        """
+        self._set_cache(namespace, key, value)
+        self._enqueue(KIND_CACHE, namespace, key, json.dumps(value))
+
+    def compact(self):
+        """
+        Rewrite the records of this session keeping only the current state.
+
+        The snapshot is taken now and applied by the writer thread in order,
+        so the writes enqueued after it are not lost.
+        """
+        now = time.time()
+        rows = [
+            (self.session, KIND_MESSAGE, "", role, content, now)
+            for role, content in self.history
+        ]
+        if self.stats:
+            rows.append((self.session, KIND_STATS, "", "", json.dumps(self.stats), now))
+        for namespace, cache in self.caches.items():
+            for key, value in cache.items():
+                rows.append(
+                    (self.session, KIND_CACHE, namespace, key, json.dumps(value), now)
+                )
+
+        self.n_rows = len(rows)
+        self._queue.put(("compact", rows))
+
+    def flush(self):
+        """
+        Wait until all the pending writes are on disk.
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        Flush the pending writes and stop the writer thread.
+        """
+        if not self._writer.is_alive():
+            return
+        self._queue.put(None)
+        self._writer.join()
+        atexit.unregister(self.close)
+
+    #
+    # internals
+    #
+    def _set_cache(self, namespace: str, key: str, value: Any):
+        cache = self.caches.setdefault(namespace, OrderedDict())
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > SESSION_STORE_MAX_CACHE_ENTRIES:
+            cache.popitem(last=False)
+
+    def _enqueue(self, kind: str, namespace: str, key: str, value: Optional[str]):
+        self.n_rows += 1
+        self._queue.put(
+            ("append", (self.session, kind, namespace, key, value, time.time()))
+        )
+
+    def _restore(self):
+        """
+        Replay the log to rebuild the in-memory state.
+        """
+        conn = _connect(self.path)
+        try:
+            cursor = conn.execute(
+                "SELECT seq, kind, namespace, key, value FROM log "
+                "WHERE session = ? ORDER BY seq",
+                (self.session,),
+            )
+            for seq, kind, namespace, key, value in cursor:
+                self.n_rows += 1
+                self._last_seq = seq
+                try:
+                    if kind == KIND_MESSAGE:
+                        self.history.append((key, value))
+                    elif kind == KIND_CLEAR_HISTORY:
+                        self.history = []
+                    elif kind == KIND_STATS:
+                        self.stats = json.loads(value)
+                    elif kind == KIND_CACHE:
+                        self._set_cache(namespace, key, json.loads(value))
+                except ValueError:
+                    # a corrupted record doesn't prevent the restore
+                    logger.warning("Skipped invalid record in session store")
+        finally:
+            conn.close()
+
+        del self.history[:-SESSION_STORE_MAX_MESSAGES]
+
+    def _write_loop(self):
+        """
+        Body of the writer thread: batch the pending records in a single transaction.
+        """
+        conn = _connect(self.path)
+        stop = False
+
+        while not stop:
+            items = [self._queue.get()]
+            # drain the queue to write in batch
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                batch = []
+                for item in items:
+                    if item is None:
+                        stop = True
+                        break
+                    op, payload = item
+                    if op == "append":
+                        batch.append(payload)
+                    elif op == "compact":
+                        self._write_batch(conn, batch)
+                        batch = []
+                        self._write_compacted(conn, payload)
+                self._write_batch(conn, batch)
+            except sqlite3.Error as e:
+                logger.error("Error writing session store: %s", e)
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+        conn.close()
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: list):
+        if batch:
+            with conn:
+                conn.executemany(INSERT, batch)
+                self._last_seq = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+
+    def _write_compacted(self, conn: sqlite3.Connection, rows: list):
+        """
+        Replace the records of this session seen so far with the snapshot
+        """
+        with conn:
+            conn.execute(
+                "DELETE FROM log WHERE session = ? AND seq <= ?",
+                (self.session, self._last_seq),
+            )
+            conn.executemany(INSERT, rows)
+            if rows:
+                self._last_seq = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        conn.execute("VACUUM")
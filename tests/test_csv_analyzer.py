@@ -0,0 +1,162 @@
+"""
+Tests for the csv_analyzer pipeline, with fake models (no calls to OCI)
+"""
+
+import sys
+
+import pandas as pd
+import pytest
+
+import csv_analyzer
+from fake_llm import FakeLLM
+from result_cache import ResultCache
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("a,b\n1,2\n3,4\n")
+    return str(path)
+
+
+@pytest.fixture
+def fake_models(monkeypatch):
+    """
+    Route code generation and answer to two fake models
+    """
+    models = {
+        "csv_generate_code": FakeLLM("```python\nprint(df['a'].sum())\n```", latency=0),
+        "csv_generate_answer": FakeLLM("The sum is 4", latency=0),
+    }
+    monkeypatch.setattr(
+        csv_analyzer,
+        "get_routed_llm",
+        lambda stage, messages, question=None: ("fake", models[stage]),
+    )
+    monkeypatch.setattr(csv_analyzer, "DEBUG", False)
+    monkeypatch.setattr(csv_analyzer, "RESULT_CACHE", ResultCache())
+    return models
+
+
+def process(csv_file, question):
+    return csv_analyzer.get_answer(
+        csv_analyzer.answer_question_stream(
+            csv_analyzer.file_fingerprint(csv_file),
+            lambda: csv_analyzer.read_csv(csv_file),
+            question,
+            cache=csv_analyzer.RESULT_CACHE,
+        )
+    )
+
+
+def test_repeated_question_is_answered_from_cache(csv_file, fake_models):
+    assert process(csv_file, "sum of a?").strip() == "The sum is 4"
+    assert process(csv_file, "sum  of a?").strip() == "The sum is 4"
+
+    assert fake_models["csv_generate_code"].n_calls == 1
+    assert fake_models["csv_generate_answer"].n_calls == 1
+
+
+def test_failing_code_is_not_cached(csv_file, fake_models):
+    fake_models["csv_generate_code"].response = "print(df['missing'])"
+
+    for _ in range(2):
+        with pytest.raises(KeyError):
+            process(csv_file, "show missing")
+
+    # the broken code is generated again, not reused
+    assert fake_models["csv_generate_code"].n_calls == 2
+
+
+def test_dataframe_with_unhashable_values(fake_models):
+    df = pd.DataFrame({"a": [1, 3], "tags": [["x"], ["y", "z"]]})
+
+    answer = csv_analyzer.process_dataframe(df, "sum of a?")
+
+    assert answer.strip() == "The sum is 4"
+
+
+def test_code_is_generated_while_the_file_is_loaded(csv_file, fake_models):
+    events = list(csv_analyzer.process_request_stream(csv_file, "sum of a?"))
+    stages = [event["stage"] for event in events if event["event"] == "stage"]
+
+    assert stages == [
+        "load_sample",
+        "generate_code",
+        "load_data",
+        "exec_code",
+        "generate_answer",
+    ]
+    assert events[-1]["answer"].strip() == "The sum is 4"
+    assert set(events[-1]["timings"]) == set(stages)
+
+
+@pytest.mark.parametrize(
+    "run",
+    [
+        lambda code, path: csv_analyzer.exec_code(csv_analyzer.read_csv(path), code),
+        lambda code, path: csv_analyzer.exec_code_out_of_core(path, code),
+    ],
+)
+def test_exec_restores_stdout(csv_file, run, monkeypatch):
+    monkeypatch.setattr(csv_analyzer, "DEBUG", False)
+    stdout = sys.stdout
+
+    assert run("print('hello')", csv_file) == "hello\n"
+    assert sys.stdout is stdout
+
+    with pytest.raises(ZeroDivisionError):
+        run("print(1 / 0)", csv_file)
+    assert sys.stdout is stdout
+
+
+def test_sample_covers_the_whole_file(tmp_path):
+    path = tmp_path / "years.csv"
+    years = [2023] * 1000 + [2024] * 1000
+    pd.DataFrame({"year": years, "name": ["a, quoted"] * 2000}).to_csv(
+        path, index=False
+    )
+
+    sample = csv_analyzer.read_csv_sample(str(path), n_rows=100)
+
+    # values that appear only after the first rows are in the sample
+    assert 0 < len(sample) <= 100
+    assert set(sample["year"]) == {2023, 2024}
+    assert set(sample["name"]) == {"a, quoted"}
+
+
+def test_sample_of_a_small_file_is_the_whole_file(csv_file):
+    sample = csv_analyzer.read_csv_sample(csv_file, n_rows=100)
+
+    pd.testing.assert_frame_equal(sample, csv_analyzer.read_csv(csv_file))
+
+
+def test_large_file_is_analyzed_out_of_core(csv_file, fake_models, monkeypatch):
+    monkeypatch.setattr(csv_analyzer, "LARGE_FILE_THRESHOLD_BYTES", 1)
+    fake_models["csv_generate_code"].response = (
+        "print(sum(chunk['a'].sum() for chunk in "
+        "pd.read_csv(file_path, chunksize=chunksize)))"
+    )
+    prompts = []
+    calls = []
+    exec_code_out_of_core = csv_analyzer.exec_code_out_of_core
+
+    def get_routed_llm(stage, messages, question=None):
+        prompts.append(messages[0].content)
+        return "fake", fake_models[stage]
+
+    def spy_exec_code_out_of_core(file_path, code):
+        calls.append(file_path)
+        return exec_code_out_of_core(file_path, code)
+
+    monkeypatch.setattr(csv_analyzer, "get_routed_llm", get_routed_llm)
+    monkeypatch.setattr(
+        csv_analyzer, "exec_code_out_of_core", spy_exec_code_out_of_core
+    )
+    monkeypatch.setattr(csv_analyzer, "exec_code", None)
+
+    events = list(csv_analyzer.process_request_stream(csv_file, "sum of a?"))
+
+    assert prompts[0] == csv_analyzer.PROMPT_ASK_CODE_LARGE_FILE
+    assert calls == [csv_file]
+    assert [e["content"] for e in events if e["event"] == "output"] == ["4\n"]
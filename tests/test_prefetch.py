@@ -0,0 +1,105 @@
+"""
+Tests for the speculative prefetch of the context
+"""
+
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+
+from context import get_context
+import prefetch
+from context import get_variable_info
+from prefetch import ContextPrefetcher
+
+
+class FakeEvents:
+    def register(self, name, callback):
+        pass
+
+    def unregister(self, name, callback):
+        pass
+
+
+class FakeShell:
+    """
+    Minimal shell: a namespace and the cells executed with exec
+    """
+
+    def __init__(self):
+        self.user_ns = {"pd": pd}
+        self.events = FakeEvents()
+
+    def run_cell(self, prefetcher, code):
+        exec(code, self.user_ns)
+        prefetcher.post_run_cell(SimpleNamespace(info=SimpleNamespace(raw_cell=code)))
+
+
+def make_prefetcher():
+    shell = FakeShell()
+    prefetcher = ContextPrefetcher(shell)
+    prefetcher.start()
+    return shell, prefetcher
+
+
+def test_prefetched_summary_is_reused():
+    shell, prefetcher = make_prefetcher()
+    shell.run_cell(prefetcher, "df = pd.DataFrame({'a': [1, 2, 3]})")
+
+    context = get_context(shell.user_ns, "analyze df", prefetcher)
+
+    assert "Variable: df" in context
+    assert prefetcher.stats()["hits"] == 1
+    prefetcher.stop()
+
+
+def test_in_place_mutation_invalidates_summary():
+    shell, prefetcher = make_prefetcher()
+    shell.run_cell(prefetcher, "df = pd.DataFrame({'a': [1, 2, 3]})")
+    get_context(shell.user_ns, "analyze df", prefetcher)
+
+    for code, expected in [
+        ("df['a'] = df['a'] * 100", "300"),
+        ("df.loc[df['a'] > 150, 'a'] = 7", "7"),
+        ("df.replace(7, 4242, inplace=True)", "4242"),
+    ]:
+        shell.run_cell(prefetcher, code)
+        context = get_context(shell.user_ns, "analyze df", prefetcher)
+        assert expected in context, code
+
+    prefetcher.stop()
+
+
+def test_mutation_through_alias_is_detected():
+    shell, prefetcher = make_prefetcher()
+    shell.run_cell(prefetcher, "df = pd.DataFrame({'a': [1, 2, 3]})\nframes = [df]")
+    get_context(shell.user_ns, "analyze df", prefetcher)
+
+    # df is not named in the cell: the content hash detects the change
+    shell.run_cell(prefetcher, "frames[0]['a'] = frames[0]['a'] * 100")
+    context = get_context(shell.user_ns, "analyze df", prefetcher)
+
+    assert "300" in context
+    prefetcher.stop()
+
+
+def test_queued_summary_is_not_waited(monkeypatch):
+    def slow_variable_info(name, value):
+        time.sleep(0.5)
+        return get_variable_info(name, value)
+
+    monkeypatch.setattr(prefetch, "get_variable_info", slow_variable_info)
+    shell, prefetcher = make_prefetcher()
+    shell.run_cell(
+        prefetcher,
+        "a, b, c, d = [pd.DataFrame({'x': [i]}) for i in range(4)]",
+    )
+
+    # d is queued behind a, b and c: it is computed inline, not waited
+    time_start = time.time()
+    context = get_context(shell.user_ns, "analyze d", prefetcher)
+
+    assert "Variable: d" in context
+    assert time.time() - time_start < 0.4
+    assert prefetcher.stats()["misses"] == 1
+    prefetcher.stop()
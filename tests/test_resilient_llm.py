@@ -0,0 +1,143 @@
+"""
+Tests for the resilient call layer, against the fake model (no calls to OCI)
+"""
+
+import time
+
+import pytest
+
+from config import LLM_HEDGE_MIN_SAMPLES
+from fake_llm import FakeLLM, FakeServiceError
+from resilient_llm import ResilientLLM
+
+MESSAGES = []
+
+
+class RecordingLLM(FakeLLM):
+    """
+    Keep a reference to the streams, so that they are closed only explicitly
+    (not by the garbage collector)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.streams = []
+
+    def stream(self, messages):
+        generator = super().stream(messages)
+        self.streams.append(generator)
+        return generator
+
+
+def make_llm(fake, **kwargs):
+    kwargs.setdefault("backoff_base", 0.01)
+    return ResilientLLM(lambda: fake, **kwargs)
+
+
+def test_retry_on_retryable_errors():
+    fake = FakeLLM("ok", latency=0, fail_first=2)
+    llm = make_llm(fake)
+
+    assert llm.invoke(MESSAGES).content == "ok"
+    assert fake.n_calls == 3
+    assert llm.stats()["retries"] == 2
+
+
+def test_no_retry_on_client_errors():
+    fake = FakeLLM(latency=0, fail_first=1, error_status=400)
+    llm = make_llm(fake)
+
+    with pytest.raises(FakeServiceError):
+        llm.invoke(MESSAGES)
+    assert fake.n_calls == 1
+
+
+def test_cooldown_after_rate_limit():
+    fake = FakeLLM("ok", latency=0, fail_first=1, error_status=429, retry_after=0.3)
+    llm = make_llm(fake)
+
+    time_start = time.time()
+    assert llm.invoke(MESSAGES).content == "ok"
+
+    assert time.time() - time_start >= 0.3
+    assert llm.stats()["throttled"] == 1
+
+
+def test_timeout():
+    llm = make_llm(FakeLLM(latency=1), timeout=0.1, max_retries=0)
+
+    time_start = time.time()
+    with pytest.raises(TimeoutError):
+        llm.invoke(MESSAGES)
+
+    assert time.time() - time_start < 0.5
+    assert llm.stats()["timeouts"] == 1
+
+
+def test_hung_calls_dont_block_new_ones():
+    fake = FakeLLM("ok", latency=2)
+    llm = make_llm(fake, timeout=0.05, max_retries=0)
+
+    for _ in range(10):
+        with pytest.raises(TimeoutError):
+            llm.invoke(MESSAGES)
+
+    fake.latency = 0
+    assert llm.invoke(MESSAGES).content == "ok"
+
+
+def prime(llm, fake):
+    """
+    Make the calls needed to enable hedging, then make the next call slow
+    """
+    for _ in range(LLM_HEDGE_MIN_SAMPLES):
+        llm.invoke(MESSAGES)
+        list(llm.stream(MESSAGES))
+    fake.slow_first = fake.n_calls + 1
+
+
+def test_hedged_request_wins():
+    fake = FakeLLM("ok", latency=0.01, slow_latency=1)
+    llm = make_llm(fake, hedge=True)
+    prime(llm, fake)
+
+    time_start = time.time()
+    assert llm.invoke(MESSAGES).content == "ok"
+
+    assert time.time() - time_start < 0.5
+    assert llm.stats()["hedge_wins"] == 1
+
+
+def test_hedged_stream_closes_the_loser():
+    fake = RecordingLLM("a fake response", latency=0.01, slow_latency=0.3)
+    llm = make_llm(fake, hedge=True)
+    prime(llm, fake)
+
+    assert "".join(chunk.content for chunk in llm.stream(MESSAGES)).strip() == (
+        "a fake response"
+    )
+    assert llm.stats()["hedge_wins"] == 1
+
+    # the slow call completes later, then its stream is closed
+    time.sleep(0.5)
+    assert fake.n_closed == 1
+
+
+def test_oci_client_without_sdk_retries(monkeypatch):
+    import oci
+    import oci_models
+    from config import LLM_TIMEOUT
+
+    created = {}
+    monkeypatch.setattr(oci_models, "AUTH", "API_KEY")
+    monkeypatch.setattr(oci.config, "from_file", lambda: {})
+    monkeypatch.setattr(
+        oci.generative_ai_inference,
+        "GenerativeAiInferenceClient",
+        lambda **kwargs: created.update(kwargs),
+    )
+    oci_models.get_client()
+
+    # retries are done only by ResilientLLM, and timed-out calls end
+    assert isinstance(created["retry_strategy"], oci.retry.NoneRetryStrategy)
+    assert created["timeout"][1] <= LLM_TIMEOUT
@@ -0,0 +1,47 @@
+"""
+Tests for the cache of csv_analyzer results
+"""
+
+import pandas as pd
+
+from result_cache import ResultCache, code_hash, dataframe_fingerprint
+
+
+def test_code_hash_ignores_formatting_and_comments():
+    assert code_hash("x = 1\nprint(x)") == code_hash("# comment\nx  =  1\n\nprint( x )")
+    assert code_hash("print(1)") != code_hash("print(2)")
+
+
+def test_dataframe_fingerprint_changes_with_data():
+    df = pd.DataFrame({"a": [1, 2, 3]})
+    fp = dataframe_fingerprint(df)
+
+    assert fp == dataframe_fingerprint(df.copy())
+    df.loc[1, "a"] = 20
+    assert fp != dataframe_fingerprint(df)
+
+
+def test_dataframe_fingerprint_with_unhashable_values():
+    df = pd.DataFrame({"a": [1, 2], "tags": [["x", "y"], ["z"]], "meta": [{}, {"k": 1}]})
+    fp = dataframe_fingerprint(df)
+
+    assert fp is not None
+    df.at[0, "tags"] = ["x"]
+    assert fp != dataframe_fingerprint(df)
+
+
+def test_eviction_by_size():
+    cache = ResultCache(max_entries=2)
+    cache.put_code("fp", "q1", "print(1)")
+    cache.put_code("fp", "q2", "print(2)")
+    cache.put_code("fp", "q3", "print(3)")
+
+    assert cache.get_code("fp", "q1") is None
+    assert cache.get_code("fp", "q3") == "print(3)"
+
+
+def test_eviction_by_age():
+    cache = ResultCache(max_age=-1)
+    cache.put_output("fp", "print(1)", "1")
+
+    assert cache.get_output("fp", "print(1)") is None
@@ -0,0 +1,99 @@
+"""
+Tests for the routing of the requests to the model profiles
+"""
+
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+
+import router
+from config import DEFAULT_PROFILE, ROUTING_MAX_FAST_TOKENS
+
+
+@pytest.fixture(autouse=True)
+def clear_stats():
+    router.clear_routing_stats()
+    yield
+    router.clear_routing_stats()
+
+
+def ask(text):
+    return [
+        SystemMessage(content="You are a helpful assistant."),
+        HumanMessage(content=text),
+    ]
+
+
+def test_simple_question_goes_to_the_route():
+    assert router.route("ask", ask("What is the median?")) == ("fast", "route")
+    assert router.route("ask_code", ask("What is the median?")) == ("large", "route")
+    # stages not in ROUTES
+    assert router.route("unknown", ask("hi")) == (DEFAULT_PROFILE, "route")
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "What is the difference between mean squared error and MAE?",
+        "Which loss function should I use for imbalanced classes?",
+        "What does standard error mean?",
+        "Is Python a good language for statistics?",
+    ],
+)
+def test_data_science_vocabulary_is_not_complex(question):
+    assert router.route("ask", ask(question)) == ("fast", "route")
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "Write a Python function to compute the RMSE",
+        "Can you fix my code?",
+        "Please refactor this script",
+        "Why does this fail?\n```\ndf.groupby('a').mean()\n```",
+        "import pandas as pd gives an error",
+    ],
+)
+def test_code_requests_are_escalated(question):
+    assert router.route("ask", ask(question)) == (DEFAULT_PROFILE, "complexity")
+
+
+def test_big_prompts_are_escalated():
+    text = "x" * (ROUTING_MAX_FAST_TOKENS * 4 + 100)
+    assert router.route("ask", ask(text)) == (DEFAULT_PROFILE, "size")
+
+
+def test_complexity_is_checked_on_the_question_only():
+    # the output of the code, in the prompt, is not the user's question
+    messages = ask(
+        "Context: Traceback (most recent call last) ...\nQuestion: how many rows?"
+    )
+
+    assert router.route("csv_generate_answer", messages, "how many rows?") == (
+        "fast",
+        "route",
+    )
+
+
+def test_routing_disabled(monkeypatch):
+    monkeypatch.setattr(router, "ROUTING_ENABLED", False)
+
+    assert router.route("ask", ask("What is the median?")) == (
+        DEFAULT_PROFILE,
+        "routing disabled",
+    )
+    # not counted
+    assert router.get_routing_stats() == {}
+
+
+def test_decisions_are_counted():
+    router.route("ask", ask("What is the median?"))
+    router.route("ask", ask("What is the mode?"))
+    router.route("ask", ask("Write a function to compute the mode"))
+
+    assert router.get_routing_stats() == {
+        ("ask", "fast", "route"): 2,
+        ("ask", DEFAULT_PROFILE, "complexity"): 1,
+    }
+
+    router.clear_routing_stats()
+    assert router.get_routing_stats() == {}
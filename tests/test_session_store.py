@@ -0,0 +1,129 @@
+"""
+Tests for the persistent session store
+"""
+
+import sqlite3
+
+from session_store import SessionStore, get_session_name, get_session_store_path
+
+
+def test_path_is_scoped_by_project(tmp_path):
+    path_a = get_session_store_path(str(tmp_path / "project_a"))
+    path_b = get_session_store_path(str(tmp_path / "project_b"))
+
+    assert path_a != path_b
+    assert path_a == get_session_store_path(str(tmp_path / "project_a"))
+
+
+def test_restore_after_restart(tmp_path):
+    path = str(tmp_path / "session.db")
+
+    store = SessionStore(path)
+    store.append_message("human", "old question")
+    store.clear_history()
+    store.append_message("human", "question")
+    store.append_message("ai", "answer")
+    store.save_stats({"genai_requests": 1})
+    store.put_cache("tokens", "key", 3)
+    store.close()
+
+    store = SessionStore(path)
+    assert store.history == [("human", "question"), ("ai", "answer")]
+    assert store.stats == {"genai_requests": 1}
+    assert store.get_cache("tokens", "key") == 3
+    store.close()
+
+
+def test_compaction_keeps_the_state(tmp_path):
+    path = str(tmp_path / "session.db")
+
+    store = SessionStore(path)
+    for i in range(10):
+        store.save_stats({"genai_requests": i})
+    store.compact()
+    store.append_message("human", "after compaction")
+    store.close()
+
+    store = SessionStore(path)
+    assert store.n_rows == 2
+    assert store.stats == {"genai_requests": 9}
+    assert store.history == [("human", "after compaction")]
+    store.close()
+
+
+def test_notebooks_in_the_same_project_are_kept_apart(tmp_path):
+    path = str(tmp_path / "session.db")
+
+    store_a = SessionStore(path, "a.ipynb")
+    store_b = SessionStore(path, "b.ipynb")
+    store_a.append_message("human", "A-q1")
+    store_a.append_message("ai", "A-a1")
+    store_a.flush()
+    store_b.append_message("human", "B-q1")
+    store_b.flush()
+    store_a.append_message("human", "A-q2")
+    store_a.flush()
+    store_b.append_message("ai", "B-a1")
+    store_b.clear_history()
+    store_b.append_message("human", "B-q2")
+    store_b.flush()
+
+    # compaction of A must not delete the rows of B
+    store_a.compact()
+    store_a.close()
+    store_b.close()
+
+    store_a = SessionStore(path, "a.ipynb")
+    store_b = SessionStore(path, "b.ipynb")
+    assert store_a.history == [("human", "A-q1"), ("ai", "A-a1"), ("human", "A-q2")]
+    assert store_b.history == [("human", "B-q2")]
+    store_a.close()
+    store_b.close()
+
+
+def test_compaction_keeps_rows_written_by_another_kernel(tmp_path):
+    path = str(tmp_path / "session.db")
+
+    store = SessionStore(path, "a.ipynb")
+    store.append_message("human", "first kernel")
+    store.flush()
+    # the same notebook, written by another kernel after the restore
+    other = SessionStore(path, "a.ipynb")
+    other.append_message("human", "second kernel")
+    other.close()
+
+    store.compact()
+    store.close()
+
+    store = SessionStore(path, "a.ipynb")
+    assert ("human", "second kernel") in store.history
+    store.close()
+
+
+def test_session_name(monkeypatch):
+    monkeypatch.delenv("JPY_SESSION_NAME", raising=False)
+    assert get_session_name() == ""
+    assert get_session_name({"__session__": "/nb/a.ipynb"}) == "/nb/a.ipynb"
+
+    monkeypatch.setenv("JPY_SESSION_NAME", "/nb/b.ipynb")
+    assert get_session_name({"__session__": "/nb/a.ipynb"}) == "/nb/b.ipynb"
+
+
+def test_db_without_session_column(tmp_path):
+    path = str(tmp_path / "session.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE log (seq INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, "
+        "namespace TEXT NOT NULL DEFAULT '', key TEXT NOT NULL DEFAULT '', "
+        "value TEXT, ts REAL NOT NULL)"
+    )
+    conn.execute(
+        "INSERT INTO log (kind, key, value, ts) VALUES ('message', 'human', 'old', 0)"
+    )
+    conn.commit()
+    conn.close()
+
+    store = SessionStore(path)
+    assert store.history == [("human", "old")]
+    store.append_message("ai", "new")
+    store.close()